@@ -0,0 +1,263 @@
+"""
+ Piico_bench.py
+
+ Piico_info benchmarks on a simulated PiicoDev bus
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+import sys
+import time
+import random
+
+try:
+    import gc
+except ImportError:
+    gc = None
+
+try:
+    import tracemalloc  # CPython
+except ImportError:
+    tracemalloc = None
+
+
+# the devices of the example in the README
+DEFAULT_POPULATION = (0x10, 0x3c, 0x52, 0x53, 0x77)
+
+
+class SimPin(object):
+    """
+    Stand-in for machine.Pin
+    """
+
+    def __init__(self, id, *args, **kwargs):
+        self.id = id
+
+    def __repr__(self):
+        return 'SimPin(%s)' % self.id
+
+
+class SimI2C(object):
+    """
+    Stand-in for machine.I2C with a simulated PiicoDev chain
+
+        population      - the ID's that acknowledge
+        latency_us      - time taken by each address probe (busy wait)
+        error_rate      - chance (0..1) of an OSError(ETIMEDOUT) on any probe
+        registers       - {(ID, register): bytes} returned by readfrom_mem()
+        max_freq        - above this frequency half the probes of a present device drop out
+
+    every probe is counted in probes, every scan() in scans
+    """
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400_000, population=DEFAULT_POPULATION,
+                 latency_us=0, error_rate=0.0, registers=None, max_freq=None, seed=1):
+        self.id = id
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.population = set(population)
+        self.latency_us = latency_us
+        self.error_rate = error_rate
+        self.registers = registers if registers != None else {}
+        self.max_freq = max_freq
+        self.random = random.Random(seed)
+        self.probes = 0
+        self.scans = 0
+
+    # one address on the wire, True if it acknowledges
+    def _probe(self, addr):
+        self.probes += 1
+        if self.latency_us:
+            end = time.perf_counter() + self.latency_us / 1_000_000
+            while time.perf_counter() < end:
+                pass
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise OSError(110)  # ETIMEDOUT, a NACK is ENODEV
+        if self.max_freq and self.freq > self.max_freq and self.random.random() < 0.5:
+            return False        # too fast for the cable, phantom drop-out
+        return addr in self.population
+
+    def init(self, freq=None, **kwargs):
+        if freq != None:
+            self.freq = freq
+
+    def scan(self):
+        self.scans += 1
+        found = []
+        for addr in range(0x08, 0x78):
+            try:
+                if self._probe(addr):
+                    found.append(addr)
+            except OSError:
+                pass
+        return found
+
+    def writeto(self, addr, buf, stop=True):
+        if not self._probe(addr):
+            raise OSError(19)   # ENODEV
+        return len(buf) + 1
+
+    def readfrom_mem(self, addr, reg, nbytes):
+        if not self._probe(addr):
+            raise OSError(19)
+        return self.registers.get((addr, reg), bytes(nbytes))[:nbytes]
+
+
+# install() - registers a simulated 'machine' module, every I2C() built by Piico_info is a SimI2C
+#  with the given settings. Must be called before Piico_info is imported.
+def install(**settings):
+    module = type(sys)('machine')
+    module.Pin = SimPin
+
+    def I2C(id=0, scl=None, sda=None, freq=400_000):
+        return SimI2C(id, scl, sda, freq, **settings)
+
+    module.I2C = I2C
+    sys.modules['machine'] = module
+    return module
+
+
+# a large external dictionary of made up third party devices, in the PiicoDev_list format
+#  a dictionary only holds one device per ID, so keys past 0x77 stand in for the extra entries
+def external_catalogue(size):
+    extlist = {}
+    for n in range(size):
+        extlist[0x08 + n % 0x70 + (n // 0x70) * 0x80] = {
+            'what': 'Third party device %d' % n,
+            'long_name': 'Some Manufacturer Third party device %d long name' % n,
+            'short_name': 'TP%d' % n}
+    return extlist
+
+
+class _Null(object):
+    def write(self, data):
+        return len(data)
+
+
+# bench(fn, repeat) - returns (microseconds per call, bytes allocated per call)
+#  the allocation is the peak of the traced memory under CPython, gc.mem_alloc() under MicroPython
+def bench(fn, repeat=100):
+    fn()    # warm up (lazy indexes etc.)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    us = (time.perf_counter() - start) * 1_000_000 / repeat
+    if tracemalloc != None:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        alloc = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+    elif gc != None and hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        base = gc.mem_alloc()
+        fn()
+        alloc = gc.mem_alloc() - base
+        gc.enable()
+    else:
+        alloc = -1
+    return us, alloc
+
+
+# run() - runs all the benchmarks, returns {name: (microseconds per call, bytes per call)}
+def run(repeat=100, latency_us=0, error_rate=0.0, population=DEFAULT_POPULATION, ext_size=500, out=None):
+    if out == None:
+        out = sys.stdout
+    install(population=population, latency_us=latency_us, error_rate=error_rate)
+    if 'Piico_info' in sys.modules:
+        del sys.modules['Piico_info']
+    from Piico_info import Piico_info
+    from Piico_catalogue import Piico_catalogue
+    import tempfile
+
+    null = _Null()
+    extlist = external_catalogue(ext_size)
+    extfile = tempfile.NamedTemporaryFile(suffix='.txt', delete=False).name
+    Piico_catalogue.create(extfile, extlist)
+    catalogue = Piico_catalogue(extfile)
+    tests = Piico_info()
+    targeted = Piico_info(targeted=True)
+    required = list(population)
+
+    cases = (
+        ('construct', lambda: Piico_info()),
+        ('construct targeted', lambda: Piico_info(targeted=True)),
+        ('construct lazy', lambda: Piico_info(lazy=True)),
+        ('rescan', lambda: tests.rescan()),
+        ('rescan targeted', lambda: targeted.rescan()),
+        ('calibrate targeted', lambda: targeted.calibrate()),
+        ('is_ID_connected', lambda: tests.is_ID_connected(0x77)),
+        ('are_connected x%d' % len(required), lambda: tests.are_connected(required)),
+        ('details what', lambda: tests.details('what', None, False, null)),
+        ('details short', lambda: tests.details('short', None, False, null)),
+        ('details long', lambda: tests.details('long', None, False, null)),
+        ('details long ext%d' % ext_size, lambda: tests.details('long', extlist, False, null)),
+        ('what_is ext%d' % ext_size, lambda: tests.what_is(0x53, 'long', extlist, null)),
+        ('show_all long', lambda: tests.show_all('long', 'show', None, null)),
+        ('show_all long ext%d' % ext_size, lambda: tests.show_all('long', 'show', extlist, null)),
+        ('lookup ext%d' % ext_size, lambda: tests.lookup(extlist)),
+        ('load file ext%d' % ext_size, lambda: Piico_catalogue(extfile)),
+        ('details long file ext%d' % ext_size, lambda: tests.details('long', catalogue, False, null)),
+    )
+    results = {}
+    out.write('%-28s %12s %12s\n' % ('benchmark', 'us/call', 'bytes/call'))
+    for name, fn in cases:
+        us, alloc = bench(fn, repeat)
+        results[name] = (us, alloc)
+        out.write('%-28s %12.1f %12d\n' % (name, us, alloc))
+    import os
+    os.remove(extfile)
+    return results
+
+
+# compare(results, baseline, tolerance) - returns the names that are more than tolerance (0.2 == 20%) slower
+def compare(results, baseline, tolerance=0.2):
+    slower = []
+    for name in results:
+        if name in baseline and results[name][0] > baseline[name][0] * (1 + tolerance):
+            slower.append(name)
+    return slower
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Piico_info benchmarks on a simulated PiicoDev bus')
+    parser.add_argument('--repeat', type=int, default=100, help='calls per benchmark')
+    parser.add_argument('--latency', type=int, default=0, help='microseconds per address probe')
+    parser.add_argument('--errors', type=float, default=0.0, help='chance (0..1) of a bus error per probe')
+    parser.add_argument('--devices', default=None, help='comma separated ID\'s on the bus, e.g. 0x3c,0x77')
+    parser.add_argument('--ext', type=int, default=500, help='size of the external dictionary')
+    parser.add_argument('--save', default=None, help='save the results as json')
+    parser.add_argument('--compare', default=None, help='json results to compare against, exit 1 if slower')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slow down for --compare')
+    args = parser.parse_args()
+
+    population = DEFAULT_POPULATION
+    if args.devices:
+        population = tuple([int(i, 0) for i in args.devices.split(',')])
+    results = run(args.repeat, args.latency, args.errors, population, args.ext)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        if slower:
+            print('slower than baseline:', ', '.join(slower))
+            sys.exit(1)
@@ -0,0 +1,119 @@
+"""
+ Piico_busset.py
+
+ Several PiicoDev i2c buses scanned in parallel
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+import time
+
+try:
+    import _thread      # second core on the RP2040, threads under CPython
+except ImportError:
+    _thread = None
+
+
+class Piico_busset(object):
+    """
+    Several i2c buses (PiicoDev chains) scanned together
+    
+        from Piico_busset import Piico_busset
+        buses = Piico_busset()
+        buses.add(0, Piico_info(lazy=True))
+        buses.add(1, Piico_info(id=1, scl=Pin(7), sda=Pin(6), lazy=True))
+        inventory = buses.scan()    # {(bus, ID): [Piico_record, ...]}
+    
+    scan() rescans the buses in parallel, one on a second thread (the second core on the RP2040)
+    and one on the calling thread, taking turns through the list until every bus is done.
+    Without _thread the buses are scanned one after the other.
+    
+        add(name, info)         - adds a Piico_info under a name (any hashable, e.g. the bus id)
+        remove(name)            - removes a bus
+        scan()                  - rescans all the buses, returns the inventory
+            scan(True)          - as above, with a full sweep on targeted buses
+        inventory(extlist)      - returns {(bus, ID): [Piico_record, ...]} of the last scans
+    """
+
+    def __init__(self):
+        self.buses = {}
+        self._lock = None
+        self._next = 0
+        self._done = 0
+        self._active = 0
+        self._error = None
+
+    # add(name, info) - adds a Piico_info under a name
+    def add(self, name, info):
+        self.buses[name] = info
+
+    # remove(name) - removes a bus
+    def remove(self, name):
+        if name in self.buses:
+            del self.buses[name]
+
+    # scan() - rescans all the buses in parallel, returns the inventory
+    def scan(self, full=False, extlist=None):
+        names = list(self.buses)
+        if _thread == None or len(names) < 2:
+            for name in names:
+                self.buses[name].rescan(full)
+            return self.inventory(extlist)
+        if self._lock == None:
+            self._lock = _thread.allocate_lock()
+        self._next = 0
+        self._done = 0
+        self._error = None
+        self._active = 1
+        _thread.start_new_thread(self._thread, (names, full))
+        self._work(names, full)
+        while self._active or self._done < len(names):  # also wait for the thread to exit,
+            time.sleep(0.001)                           #  the RP2040 only has the one spare core
+        if self._error != None:
+            raise self._error
+        return self.inventory(extlist)
+
+    # the second thread
+    def _thread(self, names, full):
+        try:
+            self._work(names, full)
+        finally:
+            self._active = 0
+
+    # take the next bus to scan until there are none left
+    def _work(self, names, full):
+        while True:
+            with self._lock:
+                n = self._next
+                self._next += 1
+            if n >= len(names):
+                return
+            try:
+                self.buses[names[n]].rescan(full)
+            except Exception as e:
+                self._error = e
+            with self._lock:
+                self._done += 1
+
+    # inventory() - returns {(bus, ID): [Piico_record, ...]} of the last scans
+    def inventory(self, extlist=None):
+        inventory = {}
+        for name in self.buses:
+            for r in self.buses[name].lookup(extlist):
+                key = (name, r.id)
+                if key in inventory:
+                    inventory[key].append(r)
+                else:
+                    inventory[key] = [r]
+        return inventory
@@ -0,0 +1,91 @@
+"""
+ Piico_catalogue.py
+
+ File-backed external (user) device dictionary for Piico_info
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+
+class Piico_catalogue(object):
+    """
+    External (user) device dictionary read from a file, use it wherever an extlist is accepted
+    
+        from Piico_catalogue import Piico_catalogue
+        ext = Piico_catalogue('extern.txt')
+        tests.details('long', ext)
+        tests.what_is(0x53, 'long', ext)
+        tests.show_all('long', 'show', ext)
+    
+    The file has one device per line, tab separated, lines starting with '#' are comments
+        # ID	what	short_name	long_name
+        0x53	Ambient Light-UV Sensor	LTR390	Adafruit LTR390 Ambient Light-UV Sensor
+    
+    Only an ID -> file offset index is kept in memory, the names are read from the file when an
+    entry is looked up. The first line for an ID wins.
+        Piico_catalogue.create('extern.txt', extern_list)   - writes a dictionary to a catalogue file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = {}
+        offset = 0
+        with open(path, 'rb') as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if line[:1] != b'#':
+                    field = line.split(b'\t', 1)[0].strip()
+                    if field:
+                        id = int(str(field, 'ascii'), 0)
+                        if id not in self._offsets:
+                            self._offsets[id] = offset
+                offset += len(line)
+
+    # the same lookups as a dictionary of devices
+    def __contains__(self, id):
+        return id in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def get(self, id, default=None):
+        if id not in self._offsets:
+            return default
+        return self[id]
+
+    # read the entry for an ID from the file, in the PiicoDev_list format
+    def __getitem__(self, id):
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[id])
+            fields = str(f.readline(), 'utf-8').rstrip('\r\n').split('\t')
+        while len(fields) < 4:
+            fields.append('')
+        return {'what': fields[1], 'short_name': fields[2], 'long_name': fields[3]}
+
+    # create(path, extlist) - writes a dictionary of devices (PiicoDev_list format) to a catalogue file
+    @staticmethod
+    def create(path, extlist):
+        with open(path, 'w') as f:
+            f.write('# ID\twhat\tshort_name\tlong_name\n')
+            for i in sorted(extlist):
+                e = extlist[i]
+                f.write('0x%02x\t%s\t%s\t%s\n' % (i, e['what'], e['short_name'], e['long_name']))
@@ -0,0 +1,224 @@
+"""
+ Piico_fleet.py
+
+ Fleet inventory of PiicoDev scan logs (host side, CPython + NumPy)
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+import sys
+import json
+
+import numpy as np
+
+from Piico_info import Piico_info, _module
+
+
+class Piico_fleet(object):
+    """
+    Fleet statistics of the connected lists collected from many boards
+
+    The scan log is JSON lines, one scan per line, either the connected list itself or an object
+        [16, 60, 82, 83, 119]
+        {"unit": "bench-07", "connected": [16, 60, 82, 83, 119]}
+
+    Each scan is packed into a 128 bit presence vector (16 bytes, bit n of byte n >> 3 set if ID n is
+    connected, the same layout as Piico_info.presence()) and the scans are counted a chunk at a time,
+    so a log of millions of scans is never held in memory. Only the last vector of each unit is kept.
+
+        fleet = Piico_fleet(bom=['SSD1306', 0x77])  # the expected devices, modules (as solve()), short_names or ID's
+        fleet.load('scans.jsonl')                   # or fleet.feed(lines), fleet.add(connected, unit)
+        fleet.attach_rates()                        # {ID: fraction of the scans the ID is connected in}
+        fleet.hotspots()                            # the conflicting ID's, most often connected first
+        fleet.drift()                               # {unit: (missing ID's, unexpected ID's)}, last scan of each unit
+        fleet.report()                              # all of the above, printed
+    """
+
+    def __init__(self, bom=None, extlist=None, chunk=65536):
+        self.info = Piico_info(lazy=True)   # the catalogues only, the bus is never opened
+        self.extlist = extlist
+        self.chunk = chunk
+        self.scans = 0
+        self.counts = np.zeros(128, dtype=np.int64)     # scans each ID is connected in
+        self.missed = np.zeros(128, dtype=np.int64)     # scans each expected ID is missing from
+        self.extra = np.zeros(128, dtype=np.int64)      # scans each unexpected ID is connected in
+        self.units = {}                                 # unit: last presence vector (bytes)
+        self.expected = None
+        if bom != None:
+            self.expected = np.frombuffer(self._pack(self._bom_ids(bom)), dtype=np.uint8)
+        self._buf = np.zeros((chunk, 16), dtype=np.uint8)
+        self._len = 0
+
+    # the ID's of the bill of materials, each device an ID, a 'short_name' of the catalogues (e.g.
+    #  'ENS160 (ASW on)'), or a module as solve() takes them, the short_name without the ASW setting
+    #  (e.g. 'ENS160'). A module is expected at the first of its addresses (ASW off first) that no
+    #  other device of the bill already has, so ['ENS160', 'ENS160'] expects both 0x53 and 0x52,
+    #  and ['VEML6040', 'VEML6030'] the VEML6030 at 0x48. The modules with the fewest addresses are
+    #  placed first. ValueError if a module has no address left, or a device is unknown.
+    #  An ID or short_name given twice is still only expected once (a presence bit per ID)
+    def _bom_ids(self, bom):
+        names = {}
+        modules = {}    # module: [(ASW on, ID), ...]
+        for r in self.info.lookup_all('show', self.extlist):
+            names.setdefault(r.short_name, r.id)
+            modules.setdefault(_module(r.short_name), []).append((' (ASW on)' in r.short_name, r.id))
+        ids = []
+        wanted = []
+        for d in bom:
+            if isinstance(d, str) and d in modules:
+                wanted.append((d, sorted(modules[d])))
+            elif isinstance(d, str):
+                if d not in names:
+                    raise ValueError('unknown device %s' % d)
+                ids.append(names[d])
+            else:
+                ids.append(d)
+        wanted.sort(key=lambda w: len(w[1]))
+        for module, addresses in wanted:
+            free = [i for on, i in addresses if i not in ids]
+            if not free:
+                raise ValueError('no address left for another %s' % module)
+            ids.append(free[0])
+        return ids
+
+    # the 16 byte presence vector of a connected list
+    @staticmethod
+    def _pack(connected):
+        vector = bytearray(16)
+        for i in connected:
+            if 0 <= i < 128:
+                vector[i >> 3] |= 1 << (i & 7)
+        return vector
+
+    # add(connected, unit) - adds one scan
+    def add(self, connected, unit=None):
+        vector = self._pack(connected)
+        self._buf[self._len] = np.frombuffer(vector, dtype=np.uint8)
+        self._len += 1
+        if unit != None:
+            self.units[unit] = bytes(vector)
+        if self._len == self.chunk:
+            self._flush()
+
+    # feed(lines) - adds the scans of an iterable of JSON lines, blank lines are skipped
+    def feed(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            scan = json.loads(line)
+            if isinstance(scan, dict):
+                self.add(scan['connected'], scan.get('unit'))
+            else:
+                self.add(scan)
+        self._flush()
+        return self
+
+    # load(path) - adds the scans of a JSON lines file, read a line at a time
+    def load(self, path):
+        with open(path) as f:
+            return self.feed(f)
+
+    # count the buffered scans
+    def _flush(self):
+        if self._len == 0:
+            return
+        vectors = self._buf[:self._len]
+        # summed as int64, the uint64 default of a uint8 sum doesn't add into the int64 counters
+        self.counts += np.unpackbits(vectors, axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+        if self.expected is not None:
+            self.missed += np.unpackbits(self.expected & ~vectors, axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+            self.extra += np.unpackbits(vectors & ~self.expected, axis=1, bitorder='little').sum(axis=0, dtype=np.int64)
+        self.scans += self._len
+        self._len = 0
+
+    # attach_rates() - returns {ID: fraction of the scans the ID is connected in}, for the ID's seen at all
+    def attach_rates(self):
+        self._flush()
+        if self.scans == 0:
+            return {}
+        seen = np.nonzero(self.counts)[0]
+        rates = self.counts[seen] / self.scans
+        return dict(zip(seen.tolist(), rates.tolist()))
+
+    # hotspots() - returns [(ID, scans, rate, (possible short_names)), ...] of the conflicting ID's that
+    #  were connected, most often connected first
+    def hotspots(self):
+        self._flush()
+        spots = []
+        for i in self.info.conflicts(self.extlist):
+            if i < 128 and self.counts[i]:
+                group = self.info.lookup_id(i, self.extlist)[0].group
+                spots.append((i, int(self.counts[i]), int(self.counts[i]) / self.scans, group))
+        spots.sort(key=lambda s: -s[1])
+        return spots
+
+    # drift() - returns {unit: (missing ID's, unexpected ID's)} of the units whose last scan differs
+    #  from the bill of materials, {} without one
+    def drift(self):
+        if self.expected is None or not self.units:
+            return {}
+        units = list(self.units)
+        vectors = np.frombuffer(b''.join([self.units[u] for u in units]), dtype=np.uint8).reshape(-1, 16)
+        missing = np.unpackbits(self.expected & ~vectors, axis=1, bitorder='little')
+        extra = np.unpackbits(vectors & ~self.expected, axis=1, bitorder='little')
+        drifted = np.nonzero(missing.any(axis=1) | extra.any(axis=1))[0]
+        result = {}
+        for n in drifted.tolist():
+            result[units[n]] = (np.nonzero(missing[n])[0].tolist(), np.nonzero(extra[n])[0].tolist())
+        return result
+
+    # report(stream) - prints the fleet statistics
+    def report(self, stream=None):
+        if stream == None:
+            stream = sys.stdout
+        rates = self.attach_rates()
+        stream.write('%d scans, %d units\n' % (self.scans, len(self.units)))
+        stream.write('\nattach rates\n')
+        for i in sorted(rates):
+            names = ', '.join([r.short_name or '?' for r in self.info.lookup_id(i, self.extlist)])
+            stream.write('%d %s %6.2f%% %s\n' % (i, hex(i), rates[i] * 100, names))
+        stream.write('\nconflict hot-spots\n')
+        for i, scans, rate, group in self.hotspots():
+            stream.write('%d %s %6.2f%% %s\n' % (i, hex(i), rate * 100, ' / '.join(group)))
+        if self.expected is not None:
+            stream.write('\nbill of materials, scans missing / unexpected\n')
+            for i in np.nonzero(self.missed | self.extra)[0].tolist():
+                stream.write('%d %s %d / %d\n' % (i, hex(i), self.missed[i], self.extra[i]))
+            drift = self.drift()
+            stream.write('\nunits drifting from the bill of materials (last scan): %d\n' % len(drift))
+            for unit in sorted(drift, key=str):
+                missing, extra = drift[unit]
+                stream.write('%s missing %s unexpected %s\n' % (unit, [hex(i) for i in missing], [hex(i) for i in extra]))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fleet statistics of PiicoDev scan logs (JSON lines)')
+    parser.add_argument('logs', nargs='*', help='scan logs, stdin if none')
+    parser.add_argument('--bom', default=None, help='comma separated expected devices, modules, short_names or ID\'s e.g. SSD1306,ENS160,0x77')
+    parser.add_argument('--chunk', type=int, default=65536, help='scans counted at a time')
+    args = parser.parse_args()
+
+    bom = None
+    if args.bom:
+        bom = [d if not d[:1].isdigit() else int(d, 0) for d in args.bom.split(',')]
+    fleet = Piico_fleet(bom, chunk=args.chunk)
+    if args.logs:
+        for path in args.logs:
+            fleet.load(path)
+    else:
+        fleet.feed(sys.stdin)
+    fleet.report()
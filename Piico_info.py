@@ -17,10 +17,281 @@
     https://https://opensource.org/license/bsd-3-clause/
 """    
 
-from machine import Pin, I2C
+import sys
+import time
+from array import array
+from collections import namedtuple
+try:
+    from machine import Pin, I2C
+except ImportError:     # host side (Piico_fleet), only the catalogues can be used
+    Pin = I2C = None
+
+try:
+    import _thread      # second core on the RP2040, threads under CPython
+except ImportError:
+    _thread = None
+
+try:
+    from micropython import const
+except ImportError:     # CPython
+    def const(value):
+        return value
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:     # CPython
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
 
 _Debug = 0	# can be chucked out, used to print short WIP messages, and to execute the function tests.
 
+# sources of an entry in the merged lookup index, the same numbering as identify() uses
+_MAIN = 0	# PiicoDev_list
+_CONF = 1	# PiicoDev_conf_list
+_EXT = 2	# user (external) dictionary
+
+# the range of ID's swept by i2c.scan()
+_SCAN_FIRST = 0x08
+_SCAN_LAST = 0x77
+
+# instrumentation
+_NACK_ERRNO = (5, 19)   # EIO (rp2), ENODEV - no device at the ID, anything else (ETIMEDOUT ...) is an error
+_HIST_BUCKETS = 24      # scan duration histogram, bucket n counts scans taking less than 2**n us
+
+# the PiicoDev addresses, both the default address, and if available the alternate address that can be
+#  selected by changing the address switch (ASW). Note the 'conflict' markers   ----vv   and    ----^^
+_LED_ID = const(0x08)			# 8.      RGB LEDS
+                                # ----vv
+_VEML6040_ID = const(0x10)		# 16. xx  Colour sensor
+_VEML6030_0_ID = const(0x10)	# 16. xx  Light sensor (ASW off)
+                                # ----^^
+_LIS3DH_1_ID = const(0x18)		# 24.     Accelerometer - ASW ON
+_LIS3DH_0_ID = const(0x19)		# 25.     Accelerometer - ASW OFF
+_TRANSCEIVER_ID = const(0x1a)	# 26.     Transceiver
+_QMC6310_ID = const(0x1c)		# 28.     Magnetometer
+_TOUCH_ID = const(0x28)			# 40.     Capacitive sensor
+_VL53L1X_ID = const(0x29)		# 41.     Laser distance sensor
+_RFID_ID = const(0x2c)			# 44.     RFID module
+                                # ----vv
+_ULTRASONIC_ID = const(0x35)	# 53. xx  Ultrasonic rangefinder
+_POTENTIOMETER_ID = const(0x35)	# 53. xx  Potentiometer
+                                # ----^^
+_SSD1306_ID = const(0x3c)		# 60.     OLED display
+_BUTTON_ID = const(0x42)		# 66.     Pushbutton
+_SERVO_ID = const(0x44)			# 68.     Servo controller
+                                # ----vv
+_TMP117_ID = const(0x48)		# 72. xx  Temperature sensor
+_VEML6030_1_ID = const(0x48)	# 72. xx  Light sensor (ASW on)
+                                # ----^^
+                                # ----vv
+_RV3028_ID = const(0x52)		# 82. xx  RTC
+_ENS160_1_ID = const(0x52)		# 82. xx  Air quality sensor (ASW on)
+                                # ----^^
+_ENS160_0_ID = const(0x53)		# 83.     Air quality sensor (ASW off)
+_BUZZER_ID = const(0x5c)		# 92.     Buzzer
+_MS5637_ID = const(0x76)		# 118.    Pressuure sensor
+_BME280_ID = const(0x77)		# 119.    Atmospheric sensor
+
+##################
+## the PiicoDev catalogue
+##################
+# ONE row per device: (ID, what, long_name, short_name, initme)
+#  the first device of an ID goes into PiicoDev_list, a second device at the same ID into
+#  PiicoDev_conf_list, so the rows of a conflicting ID are in order of preference (default first)
+_PIICODEV = (
+    (_LED_ID, 'RGB LED Module', 'PiicoDev 3x RGB LED Module', 'LED',
+        'PiicoDev_RGB.PiicoDev_RGB'),
+    (_VEML6040_ID, 'Colour Sensor', 'PiicoDev VEML6040 Colour Sensor', 'VEML6040',
+        'PiicoDev_VEML6040.PiicoDev_VEML6040'),
+    (_VEML6030_0_ID, 'Ambient Light Sensor (ASW off)', 'PiicoDev VEML6030 Ambient Light Sensor (ASW off)', 'VEML6030 (ASW off)',
+        'PiicoDev_VEML6030.PiicoDev_VEML6030'),
+    (_LIS3DH_1_ID, 'Accelerometer (ASW on)', 'PiicoDev 3-Axis Accelerometer LIS3DH (ASW on)', 'LIS3DH (ASW on)',
+        'PiicoDev_LIS3DH.PiicoDev_LIS3DH'),
+    (_LIS3DH_0_ID, 'Accelerometer (ASW off)', 'PiicoDev 3-Axis Accelerometer LIS3DH (ASW off)', 'LIS3DH (ASW off)',
+        'PiicoDev_LIS3DH.PiicoDev_LIS3DH'),
+    (_TRANSCEIVER_ID, 'Transceiver', 'PiicoDev Transceiver 915MHz', 'TRANSCEIVER',
+        'PiicoDev_Transceiver.PiicoDev_Transceiver'),
+    (_QMC6310_ID, 'Magnetometer', 'PiicoDev Magnetometer QMC6310', 'QMC6310',
+        'PiicoDev_QMC6310.PiicoDev_QMC6310'),
+    (_TOUCH_ID, 'Capacitive Touch Sensor', 'PiicoDev Capacitive Touch Sensor', 'TOUCH',
+        'PiicoDev_CAP1203.PiicoDev_CAP1203'),
+    (_VL53L1X_ID, 'Laser Distance Sensor', 'PiicoDev Laser Distance Sensor VL53L1X', 'VL53L1X',
+        'PiicoDev_VL53L1X.PiicoDev_VL53L1X'),
+    (_RFID_ID, 'RFID Module', 'PiicoDev RFID Module (NFC 13.56MHz)', 'RFID',
+        'PiicoDev_RFID.PiicoDev_RFID'),
+    (_ULTRASONIC_ID, 'Ultrasonic Rangefinder', 'PiicoDev Ultrasonic Rangefinder Module', 'ULTRASONIC',
+        'PiicoDev_Ultrasonic.PiicoDev_Ultrasonic'),
+    (_POTENTIOMETER_ID, 'Potentiometer', 'PiicoDev Potentiometer (Rotary)', 'Potentiometer',
+        'PiicoDev_Potentiometer.PiicoDev_Potentiometer'),
+    (_SSD1306_ID, 'OLED Module', 'PiicoDev OLED Module SSD1306', 'SSD1306',
+        'PiicoDev_SSD1306.create_PiicoDev_SSD1306'),
+    (_BUTTON_ID, 'Button', 'PiicoDev Button', 'BUTTON',
+        'PiicoDev_Switch.PiicoDev_Switch'),
+    (_SERVO_ID, 'Servo Driver', 'PiicoDev Servo Driver (4 Channel)', 'SERVO',
+        'PiicoDev_Servo.PiicoDev_Servo_Driver'),
+    (_TMP117_ID, 'Precision Temperature Sensor', 'PiicoDev TMP117 Precision Temperature Sensor', 'TMP117',
+        'PiicoDev_TMP117.PiicoDev_TMP117'),
+    (_VEML6030_1_ID, 'Ambient Light Sensor (ASW on)', 'PiicoDev VEML6030 Ambient Light Sensor (ASW on)', 'VEML6030 (ASW on)',
+        'PiicoDev_VEML6030.PiicoDev_VEML6030'),
+    (_RV3028_ID, 'Real Time Clock', 'PiicoDev Real Time Clock (RTC) RV3028', 'RV3028',
+        'PiicoDev_RV3028.PiicoDev_RV3028'),
+    (_ENS160_1_ID, 'Air Quality Sensor (ASW on)', 'PiicoDev Air Quality Sensor ENS160 (ASW on)', 'ENS160 (ASW on)',
+        'PiicoDev_ENS160.PiicoDev_ENS160'),
+    (_ENS160_0_ID, 'Air Quality Sensor (ASW off)', 'PiicoDev Air Quality Sensor ENS160 (ASW off)', 'ENS160 (ASW off)',
+        'PiicoDev_ENS160.PiicoDev_ENS160'),
+    (_BUZZER_ID, 'Buzzer Module', 'PiicoDev Buzzer Module', 'BUZZER',
+        'PiicoDev_Buzzer.PiicoDev_Buzzer'),
+    (_MS5637_ID, 'Pressure Sensor', 'PiicoDev Pressure Sensor MS5637', 'MS5637',
+        'PiicoDev_MS5637.PiicoDev_MS5637'),
+    (_BME280_ID, 'Atmospheric Sensor', 'PiicoDev BME280 Atmospheric Sensor', 'BME280',
+        'PiicoDev_BME280.PiicoDev_BME280'),
+)
+
+
+class _Piico_rows(object):
+    """
+    The main or conflicts dictionary of the catalogue, read straight from the catalogue rows
+    Only an ID -> row index is kept at import, the entry (a dictionary in the PiicoDev_list format)
+    of an ID is built the first time it is used, then kept
+    """
+
+    def __init__(self, table):
+        self._table = table
+        self._rows = {}
+        self._entries = {}
+
+    # the same lookups as a dictionary of devices
+    def __contains__(self, id):
+        return id in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def keys(self):
+        return self._rows.keys()
+
+    def get(self, id, default=None):
+        if id not in self._rows:
+            return default
+        return self[id]
+
+    def __getitem__(self, id):
+        if id in self._entries:
+            return self._entries[id]
+        i, what, long_name, short_name, initme = self._table[self._rows[id]]
+        entry = {'what': what, 'long_name': long_name, 'short_name': short_name, 'initme': initme}
+        self._entries[id] = entry
+        return entry
+
+
+# _catalogue(rows) - returns the main and conflicts dictionaries of the catalogue rows
+#  the first row of an ID is the main entry, a second row at that ID is its conflict entry
+#  the dictionaries only hold two devices per ID, a third is an error rather than a silently lost entry
+def _catalogue(rows):
+    main = _Piico_rows(rows)
+    conf = _Piico_rows(rows)
+    for n in range(len(rows)):
+        id = rows[n][0]
+        if id not in main:
+            main._rows[id] = n
+        elif id not in conf:
+            conf._rows[id] = n
+        else:
+            raise ValueError('more than two devices at ID %d (0x%x)' % (id, id))
+    return main, conf
+
+
+# _fnv1a(text) - the 32 bit FNV-1a hash of a string
+def _fnv1a(text):
+    h = 0x811c9dc5
+    for c in text.encode():
+        h = ((h ^ c) * 0x01000193) & 0xffffffff
+    return h
+
+
+# _has(snap, id) - returns 1 if the ID is set in the presence bitmap of a snapshot, otherwise 0
+#  anything that isn't an int (None, 119.0 ...) is looked for in the connected list instead, as before the bitmap
+def _has(snap, id):
+    try:
+        if 0 <= id < 128 and snap.present[id >> 3] & (1 << (id & 7)):
+            return(1)
+        return(0)
+    except TypeError:
+        return(1) if id in snap.connected else (0)
+
+
+# what the reporting functions return, one per device (and per possible device of a conflicting ID)
+Piico_record = namedtuple('Piico_record', ('id', 'source', 'what', 'short_name', 'long_name', 'group'))
+
+# one complete scan result, swapped in whole so readers on another thread/core never see a partial one
+#  connected is the list of ID's (don't modify it), present the 16 byte presence bitmap
+Piico_snapshot = namedtuple('Piico_snapshot', ('generation', 'connected', 'present'))
+
+# what solve() returns, one per possible assignment of modules to the connected ID's
+#  devices is ((ID, short_name), ...), missing/extra are the modules short of/beyond the bill of materials
+Piico_assignment = namedtuple('Piico_assignment', ('mismatch', 'alternates', 'devices', 'missing', 'extra'))
+
+
+# _module(short_name) - the physical module of a dictionary entry, the short_name without the ASW setting
+#  e.g. 'VEML6030 (ASW on)' and 'VEML6030 (ASW off)' are both the 'VEML6030' module
+def _module(short_name):
+    n = short_name.find(' (ASW')
+    return short_name if n < 0 else short_name[:n]
+
+
+class Piico_report(object):
+    """
+    Report writer, formats a whole report into one preallocated buffer so it can be written
+    to a stream (console, UART, file) in a single call instead of a print() per line
+        report = Piico_report()
+        report.line('some text')
+        report.entry(0x3c, 'OLED Module')   # '60 0x3c OLED Module', as printed by details()
+        report.write()                      # sys.stdout, or any stream with write()
+        report.text()                       # or get it as a string
+    the buffer grows if a report doesn't fit, and is reused by the next report
+    """
+
+    def __init__(self, size=1024):
+        self.buf = bytearray(size)
+        self.len = 0
+
+    # reset() - empties the buffer for the next report
+    def reset(self):
+        self.len = 0
+
+    # line(text) - adds a line of text
+    def line(self, text):
+        data = text.encode()
+        end = self.len + len(data) + 1
+        if end > len(self.buf):
+            self.buf.extend(bytearray(max(end - len(self.buf), len(self.buf))))
+        self.buf[self.len:end - 1] = data
+        self.buf[end - 1] = 10  # '\n'
+        self.len = end
+
+    # entry(id, name) - adds a line in the same format as details(), e.g. '60 0x3c OLED Module'
+    def entry(self, id, name):
+        self.line('%d %s %s' % (id, hex(id), name))
+
+    # text() - returns the report as a string
+    def text(self):
+        return str(self.buf[:self.len], 'utf-8')
+
+    # write(stream) - writes the report to the stream in one call, sys.stdout if not given
+    def write(self, stream=None):
+        if stream == None:
+            stream = sys.stdout
+        try:
+            stream.write(memoryview(self.buf)[:self.len])
+        except TypeError:   # text only stream, e.g. CPython sys.stdout
+            stream.write(self.text())
+
 
 class Piico_info(object):
     """
@@ -45,6 +316,19 @@ class Piico_info(object):
     OR
         # for an alternate i2c bus on GPIO6 and GPOI7
         test_altbus = Piico_info(id=1, scl=Pin(7), sda=Pin(6))
+    OR
+        # targeted scan, only the ~20 catalogued ID's are probed instead of the whole bus
+        tests = Piico_info(targeted=True)
+        # ... optionally also probing the ID's of an external dictionary (see details() below)
+        tests = Piico_info(targeted=True, extlist=extern_list)
+    OR
+        # an i2c bus that is already open (or a stand-in for testing)
+        tests = Piico_info(i2c=my_i2c)
+    OR
+        # lazy, the bus is only opened and scanned when first needed (or by prefetch())
+        tests = Piico_info(lazy=True)
+        ...                     # e.g. bring up the display and watchdog first
+        tests.prefetch()
     
     Immediately after this you can display what has been detected on the default i2c bus by either
     
@@ -57,17 +341,47 @@ class Piico_info(object):
         
     Available functions
     -------------------
+        prefetch()              - opens the i2c bus and does the first scan now (lazy mode)
         clear()                 - clears the list of connected i2c devices
         rescan()                - clears and rescans the default i2c bus and repopulates the list
+            rescan(True)        - as above, but always a full sweep of the bus even in targeted mode
+                                  both return (added, removed) lists of ID's compared to the previous list
+        on_change(callback)     - registers callback(id, attached) called by rescan() for every ID that
+                                  attaches (attached == 1) or detaches (attached == 0)
+            on_change(callback, id) - as above, only for the given ID
+        remove_callback(callback)   - unregisters a callback (use the same id as on_change())
+        scan()                  - returns the list of ID's that answer, without changing the connected list
+        rescan_async(full, batch)   - coroutine version of rescan() that yields to other tasks every batch probes
+                                      e.g.  added, removed = await tests.rescan_async(False, 4)
+        scan_async(full, batch)     - coroutine version of scan()
+        probe(id)               - returns 1 if a device acknowledges the ID, otherwise 0
+        set_probe(probe_set)    - sets the ID's probed in targeted mode (default is all catalogued ID's)
         show_int()              - prints the list of connected ID's in DECIMAL detected by the original/most recent scan
         show_hex()              - prints the list of connected ID's in HEXADECIMAL detected by the original/most recent scan
         is_ID_connected(id)     - returns 1 if the ID is in the list, otherwise 0
         how_many_connected()    - returns count of detected ID's
+        are_connected(ids)      - returns a tuple of 1/0 for each of the ID's in ids, in the same order
+        connected_mask(ids)     - returns an int with bit n set if ids[n] is connected
+        missing(expected)       - returns the list of expected ID's that are not connected
+        unexpected(expected)    - returns the list of connected ID's that are not in expected
+        presence()              - returns the connected ID's as a 128 bit int, bit n set if ID n is connected
+        identify(id)            - returns the dictionary entry of the device actually at a connected ID, or None
+                                  conflicting ID's are resolved by reading the device ID register (cached per scan)
+        is_device_connected(short_name) - returns 1 if a device with that 'short_name' is identified, otherwise 0
+                                  e.g. is_device_connected('Potentiometer')
+        
+        driver(id)              - returns the PiicoDev driver of the device at a connected ID (None if there isn't one)
+                                  the driver module is only imported when needed, the driver is created on this
+                                  bus and kept until the device detaches. driver(0x77, iir=2) passes arguments
+        drivers()               - creates the drivers of all the connected devices, returns {ID: driver}
+        set_driver(id, factory) - use factory(i2c, id, **kwargs) to create the driver for an ID
         
         details()               - prints 'human name' of the connected ID's e.g. 'OLED Module' (default is 'what')
             details('what')     - prints 'human name' of the connected ID's e.g. 'OLED Module'       
             details('short')    - prints 'short_name' of the connected ID's e.g. 'SSD1306'
             details('long')     - prints 'long_name' of the connected ID's e.g. 'PiicoDev OLED Module SSD1306'
+            details('what', None, True) - as above, but conflicting ID's that identify() can resolve
+                                          only print the device actually connected
         *****
         The details() function can also access a user defined dictionary of devices from other manufacturers.
         The user dictionary MUST be in the same format as the internal dictionaries
@@ -83,6 +397,11 @@ class Piico_info(object):
                     'short_name': 'MFR code'},
             }
 
+        A large user dictionary can instead be kept in a file and used in the same way, only an index is kept
+        in memory (see Piico_catalogue.py)
+            from Piico_catalogue import Piico_catalogue
+            extern_list = Piico_catalogue('extern.txt')
+
         then calling the details() function as below _AFTER_ the user dictionary is defined, will
         display this if the LTR390 is in the connected devices list
         
@@ -90,6 +409,11 @@ class Piico_info(object):
             details('short', extern_list) - prints 'short_name' of the connected ID's e.g. 'LTR390'
             details('long', extern_list)  - prints 'long_name' of the connected ID's e.g. 'Adafruit LTR390 Ambient Light-UV Sensor'
 
+        conflicts()             - returns the sorted list of ID's with more than one possible device
+            conflicts(extlist)  - as above, including the external user dictionary
+        solve()                 - returns the possible assignments of modules to the connected ID's, best first
+            solve(bom)          - ranked against the expected modules e.g. {'VEML6030': 1, 'ENS160': 1}
+            solve(bom, extlist, resolve=True) - also the external dictionary, and identify() the conflicting ID's
         what_is(id)             - prints 'human name' of the given ID e.g. 'RGB LED Module' (default is 'what')
             what_is(id, 'what') - prints 'human name' of the given ID e.g. 'RGB LED Module'
             what_is(id, 'short')- prints 'short_name' of the given ID e.g. 'LED'
@@ -104,6 +428,92 @@ class Piico_info(object):
             show_all('short', show')    - prints all 'shout names' from the conflict internal dictonary
             show_all('long', 'show')    - prints all 'long names' from the conflict internal dictonary
             
+    Snapshots
+    ---------
+        snapshot()              - returns the current Piico_snapshot (generation, connected, present)
+        start_scanner(period_ms, full) - rescans in the background on a second thread (core1 on the RP2040)
+        stop_scanner()          - stops the background scanner
+    A rescan builds a new snapshot and swaps it in once complete, the old list stays in place until then,
+    so a reader on another thread/core never waits and never sees an empty or partial list.
+    
+    Uplink reports
+    --------------
+    Piico_uplink (its own module, Piico_uplink.py) encodes the inventory for a low bandwidth link
+        board = Piico_uplink(tests)
+        board.encode()          - returns a compact binary report (~20 bytes full, a few bytes as a delta)
+        Piico_uplink().decode(data) - returns the Piico_inventory (seq, connected, devices) upstream
+    
+    Shared bus
+    ----------
+        display = Piico_info(shared=True)       # opens and scans the bus
+        sensors = Piico_info(shared=True)       # same bus object and scan result, no second scan
+        invalidate()            - forgets the scan result, the next use scans again, once for all of them
+    Every shared instance on the same bus (id, scl, sda, freq) with the same scan mode (targeted and the
+    probe set given to the constructor) uses one i2c bus object and one scan result. A full and a targeted
+    instance on one bus don't share, so neither gets the other's scan.
+    A rescan() by any of them is picked up by the others on their next use (firing their own callbacks).
+    
+    Warm start
+    ----------
+        tests = Piico_info(cache='piico.txt')   # first boot scans and saves the connected ID's
+        ...                                     # later boots only probe the saved ID's
+        tests.from_cache        - 1 if the list came from the cache file, 0 if it was scanned
+        save_topology()         - saves the connected ID's and a fingerprint of the bus setup
+        forget_topology()       - deletes the cache file, the next start does a full scan
+    The saved ID's are used if the fingerprint matches and every one of them answers, otherwise it's a full
+    scan. rescan() saves again whenever the list changes. NOTE: a device ADDED since the file was saved is
+    only seen after a rescan().
+    
+    Bus frequency
+    -------------
+        tests = Piico_info(autofreq=True)       # calibrates on the first scan, once per bus
+        calibrate()             - finds and sets the fastest frequency (100k/400k/1M) that gives the same
+                                  scan result repeatedly, returns it. The result is cached per bus
+            calibrate(ladder, repeats)  - e.g. calibrate((100_000, 400_000), 5)
+    
+    Instrumentation
+    ---------------
+        tests = Piico_info(instrument=True)     # or tests.instrument() later
+        instrument(on)          - starts (stops) recording probe latency, ACK/NACK/error counts and scan times
+        stats()                 - returns the counters, see below, None if not instrumented
+        reset_stats()           - zeroes the counters
+    
+        {'scans': count, 'scan_us': total, 'scan_us_max': longest,
+         'scan_hist': [count of scans taking < 2**n us, ...],
+         'ids': {ID: (acks, nacks, errors, mean probe us, max probe us), ...}}
+    
+    Presence monitor
+    ----------------
+    Piico_monitor (its own module, Piico_monitor.py) supervises an expected set of ID's
+        monitor = Piico_monitor(tests, [0x3c, 0x77], debounce=3, size=32)
+        monitor.poll()          - probes the expected ID's, True if a debounced state changed, allocates nothing
+        monitor.events()        - returns the attach/detach events [(ticks_us, ID, attached), ...] from a ring buffer
+    
+    Several buses
+    -------------
+    Piico_busset (its own module, Piico_busset.py) scans several buses in parallel (second core / thread)
+    into one inventory
+        from Piico_busset import Piico_busset
+        buses = Piico_busset()
+        buses.add(0, Piico_info(lazy=True))
+        buses.add(1, Piico_info(id=1, scl=Pin(7), sda=Pin(6), lazy=True))
+        inventory = buses.scan()    # {(bus, ID): [Piico_record, ...]}
+    
+    Results and reports
+    -------------------
+    show_int(), show_hex(), details(), what_is() and show_all() also return their results, and take an
+    optional stream as the last argument (default sys.stdout). The whole report is formatted into one buffer
+    (a Piico_report, tests.report, allocated by the first report) and written with a single write() call,
+    instead of a print() per line.
+    details(), what_is() and show_all() return a list of records, one per device
+        Piico_record(id, source, what, short_name, long_name, group)
+            source  - 0 main, 1 conflicts, 2 external dictionary, None for an unknown device
+            group   - the 'short_name' of every possible device at that ID, empty if there is no conflict
+    
+        lookup(extlist, resolve)    - returns the records of details(), without printing anything
+        lookup_id(id, extlist)      - returns the records of what_is(), without printing anything
+        lookup_all(conf, extlist)   - returns the records of show_all(), without printing anything
+    
     Address conflicts
     -----------------
     Where appropriate this module will provide information about potential conflicts, since some PiicoDev devices
@@ -114,6 +524,10 @@ class Piico_info(object):
     
     ** The module CANNOT detect an actual address conflict on a given i2c bus. This is a characteristic of the bus itself.
     
+    For the conflicting ID's identify() reads a chip ID / WHO_AM_I register to tell which device is actually
+    connected: 0x35 (Ultrasonic/Potentiometer), 0x48 (TMP117/VEML6030) and 0x52 (RV3028/ENS160).
+    0x10 (VEML6030/VEML6040) can't be resolved, neither device has an ID register.
+    
     'Constant' values
     -----------------
     Internally there is a set of constant names for the PiicoDev addresses, both the default address, and
@@ -132,193 +546,796 @@ class Piico_info(object):
     
     NOTE: =============================================================================
     NOTE:
-    NOTE: The "Constants" and the __TWO__ dictionary lists MUST be checked / updated
-    NOTE:    when new PiicoDev devices are created by Core Electronics
-    NOTE:     sorry team ;-)
+    NOTE: New PiicoDev devices by Core Electronics need an address "constant" and a row
+    NOTE:    in the catalogue (_PIICODEV), the main and conflicts lists are built from it
+    NOTE:    the first row of an ID is the main entry, a second row at that ID is a conflict
     NOTE:
     NOTE: =============================================================================
     """
     
-    #
-    # declare "CONSTANTS"
-    # these are used to uniquely identify the various (conflicting) PiicoDev addresses
-    #  note the 'conflict' markers   ----vv   and    ----^^
-
-    __LED_ID = 0x8				# 8.      RGB LEDS
-                                # ----vv
-    __VEML6030_0_ID = 0x10		# 16. xx  Light sensor (ASW off)
-    __VEML6040_ID = 0x10		# 16. xx  Colour sensor
-                                # ----^^
-    __LIS3DH_1_ID = 0x18		# 24.     Accelerometer - ASW ON
-    __LIS3DH_0_ID = 0x19		# 25.     Accelerometer - ASW OFF
-    __TRANSCEIVER_ID = 0x1a		# 26.     Transceiver
-    __QMC6310_ID = 0x1c			# 28.     Magnetometer
-    __TOUCH_ID = 0x28			# 40.     Capacitive sensor
-    __VL53L1X_ID = 0x29			# 41.     Laser distance sensor
-    __RFID_ID = 0x2c			# 44.     RFID module
-                                # ----vv
-    __ULTRASONIC_ID = 0x35		# 53. xx  Ultrasonic rangefinder
-    __POTENTIOMETER_ID = 0x35	# 53. xx  Potentiometer
-                                # ----^^
-    __SSD1306_ID = 0x3c			# 60.     OLED display
-    __BUTTON_ID = 0x42			# 66.     Pushbutton
-    __SERVO_ID = 0x44			# 68.     Servo controller
-                                # ----vv
-    __TMP117_ID = 0x48			# 72. xx  Temperature sensor
-    __VEML6030_1_ID = 0x48		# 72. xx  Light sensor (ASW on)
-                                # ----^^
-                                # ----vv
-    __RV3028_ID = 0x52			# 82. xx  RTC
-    __ENS160_1_ID = 0x52		# 82. xx  Air quality sensor (ASW on)
-                                # ----^^
-    __ENS160_0_ID = 0x53		# 83.     Air quality sensor (ASW off)
-    __BUZZER_ID = 0x5c			# 92.     Buzzer
-    __MS5637_ID = 0x76			# 118.    Pressuure sensor
-    __BME280_ID = 0x77			# 119.    Atmospheric sensor
+    # the address "constants" for user code (tests.__BME280_ID), the const() values are in the module
+    __LED_ID = _LED_ID
+    __VEML6030_0_ID = _VEML6030_0_ID
+    __VEML6040_ID = _VEML6040_ID
+    __LIS3DH_1_ID = _LIS3DH_1_ID
+    __LIS3DH_0_ID = _LIS3DH_0_ID
+    __TRANSCEIVER_ID = _TRANSCEIVER_ID
+    __QMC6310_ID = _QMC6310_ID
+    __TOUCH_ID = _TOUCH_ID
+    __VL53L1X_ID = _VL53L1X_ID
+    __RFID_ID = _RFID_ID
+    __ULTRASONIC_ID = _ULTRASONIC_ID
+    __POTENTIOMETER_ID = _POTENTIOMETER_ID
+    __SSD1306_ID = _SSD1306_ID
+    __BUTTON_ID = _BUTTON_ID
+    __SERVO_ID = _SERVO_ID
+    __TMP117_ID = _TMP117_ID
+    __VEML6030_1_ID = _VEML6030_1_ID
+    __RV3028_ID = _RV3028_ID
+    __ENS160_1_ID = _ENS160_1_ID
+    __ENS160_0_ID = _ENS160_0_ID
+    __BUZZER_ID = _BUZZER_ID
+    __MS5637_ID = _MS5637_ID
+    __BME280_ID = _BME280_ID
 
     ################
-    ## the MAIN list
+    ## the MAIN and conflicts lists
     ################
-    # the dictionary of the fixed, and where possible the default (ASW off) ID's
-    #  also has some non-conflicting (ASW on) ID's
-    PiicoDev_list: dict = {
-        __LED_ID: {			# 8.   0x8
-            'what': 'RGB LED Module',
-            'long_name': 'PiicoDev 3x RGB LED Module',
-            'short_name': 'LED'},
-        __VEML6040_ID: {		# 16.  0x10
-            'what': 'Colour Sensor',
-            'long_name': 'PiicoDev VEML6040 Colour Sensor',
-            'short_name': 'VEML6040'},
-        __LIS3DH_1_ID: {		# 24.  0x18
-            'what': 'Accelerometer (ASW on)',
-            'long_name': 'PiicoDev 3-Axis Accelerometer LIS3DH (ASW on)',
-            'short_name': 'LIS3DH (ASW on)'},
-        __LIS3DH_0_ID: {		# 25.  0x19
-            'what': 'Accelerometer (ASW off)',
-            'long_name': 'PiicoDev 3-Axis Accelerometer LIS3DH (ASW off)',
-            'short_name': 'LIS3DH (ASW off)'},
-        __TRANSCEIVER_ID: {		# 26.  0x1A
-            'what': 'Transceiver',
-            'long_name': 'PiicoDev Transceiver 915MHz',
-            'short_name': 'TRANSCEIVER'},
-        __QMC6310_ID: {		# 28.  0x1c
-            'what': 'Magnetometer',
-            'long_name': 'PiicoDev Magnetometer QMC6310',
-            'short_name': 'QMC6310'},
-        __TOUCH_ID: {		# 40.  0x28
-            'what': 'Capacitive Touch Sensor',
-            'long_name': 'PiicoDev Capacitive Touch Sensor',
-            'short_name': 'TOUCH'},
-        __VL53L1X_ID: {		# 41.  0x29
-            'what': 'Laser Distance Sensor',
-            'long_name': 'PiicoDev Laser Distance Sensor VL53L1X',
-            'short_name': 'VL53L1X'},
-        __RFID_ID: {		# 45.  0x2c
-            'what': 'RFID Module',
-            'long_name': 'PiicoDev RFID Module (NFC 13.56MHz)',
-            'short_name': 'RFID'},
-        __ULTRASONIC_ID: {	# 53.  0x35
-           'what': 'Ultrasonic Rangefinder',
-            'long_name': 'PiicoDev Ultrasonic Rangefinder Module',
-            'short_name': 'ULTRASONIC'},
-        __SSD1306_ID: {		# 60.  0x3c
-            'what': 'OLED Module',
-            'long_name': 'PiicoDev OLED Module SSD1306',
-            'short_name': 'SSD1306',
-            'initme': 'create_PiicoDev_SSD1306()'},
-        __BUTTON_ID: {		# 66.  0x42
-            'what': 'Button',
-            'long_name': 'PiicoDev Button',
-            'short_name': 'BUTTON'},
-        __SERVO_ID: {		# 68.  0x44
-            'what': 'Servo Driver',
-            'long_name': 'PiicoDev Servo Driver (4 Channel)',
-            'short_name': 'SERVO'},
-        __TMP117_ID: {		# 72.  0x48
-            'what': 'Precision Temperature Sensor',
-            'long_name': 'PiicoDev TMP117 Precision Temperature Sensor',
-            'short_name': 'TMP117'},
-        __RV3028_ID: {		# 82.  0x52
-            'what': 'Real Time Clock',
-            'long_name': 'PiicoDev Real Time Clock (RTC) RV3028',
-            'short_name': 'RV3028'},
-        __ENS160_0_ID: {		# 83.  0x53
-            'what': 'Air Quality Sensor (ASW off)',
-            'long_name': 'PiicoDev Air Quality Sensor ENS160 (ASW off)',
-            'short_name': 'ENS160 (ASW off)'},
-        __BUZZER_ID: {		# 92.  0x5c
-            'what': 'Buzzer Module',
-            'long_name': 'PiicoDev Buzzer Module',
-            'short_name': 'BUZZER'},
-        __MS5637_ID: {		# 118.  0x76
-            'what': 'Pressure Sensor',
-            'long_name': 'PiicoDev Pressure Sensor MS5637',
-            'short_name': 'MS5637'},
-        __BME280_ID: {		# 119.  0x77
-            'what': 'Atmospheric Sensor',
-            'long_name': 'PiicoDev BME280 Atmospheric Sensor',
-            'short_name': 'BME280'},
+    # read straight from the catalogue rows (_PIICODEV), an entry is only built when it is first used
+    #  PiicoDev_list has the fixed, and where possible the default (ASW off) ID's,
+    #   also some non-conflicting (ASW on) ID's
+    #  PiicoDev_conf_list has the second device of each conflicting ID
+    PiicoDev_list, PiicoDev_conf_list = _catalogue(_PIICODEV)
+
+    # details() modes to dictionary keys, anything else is 'what'
+    _keys: dict = {
+        'what': 'what',
+        'short': 'short_name',
+        'long': 'long_name',
     }
 
-    #####################
-    ## the conflicts list
-    #####################
-    # the dictionary of the conflicting fixed, and conflicting (ASW on) ID's
-    #  also has some conflicting (ASW off) ID's
-    PiicoDev_conf_list: dict = {
-        __VEML6030_0_ID: {		# 16.  0x10
-            'what': 'Ambient Light Sensor (ASW off)',
-            'long_name': 'PiicoDev VEML6030 Ambient Light Sensor (ASW off)',
-            'short_name': 'VEML6030 (ASW off)'},
-        __POTENTIOMETER_ID: {	# 53.  0x35
-           'what': 'Potentiometer',
-            'long_name': 'PiicoDev Potentiometer (Rotary)',
-            'short_name': 'Potentiometer'},
-        __VEML6030_1_ID: {	# 72.  0x48
-            'what': 'Ambient Light Sensor (ASW on)',
-            'long_name': 'PiicoDev VEML6030 Ambient Light Sensor (ASW on)',
-            'short_name': 'VEML6030 (ASW on)'},
-        __ENS160_1_ID: {		# 82.  0x52
-            'what': 'Air Quality Sensor (ASW on)',
-            'long_name': 'PiicoDev Air Quality Sensor ENS160 (ASW on)',
-            'short_name': 'ENS160 (ASW on)'},
+    # the merged lookup index of the internal dictionaries, built on first use by _lookup()
+    _base_index = None
+    _base_ambiguity = None
+    _main_ids = ()
+    _conf_ids = ()
+
+    # the buses (id, scl, sda, freq, targeted, probe set) of the shared=True instances
+    _buses: dict = {}
+
+    # calibrate() frequencies to try, and the result for each calibrated bus
+    _freq_ladder = (100_000, 400_000, 1_000_000)
+    _freq_cache: dict = {}
+
+    ####################
+    ## the identify list
+    ####################
+    # register tests to tell apart the devices sharing a conflicting ID, used by identify()
+    #  ID: (register, bytes, byte order, mask, ((value, dictionary), ...), otherwise)
+    #   dictionary is _MAIN for the main list, _CONF for the conflicts list
+    #   otherwise is the dictionary to use if the register reads a value not in the list,
+    #    None leaves it unresolved
+    #  the VEML6030/VEML6040 (0x10) have no ID register, so that conflict stays unresolved
+    _identify_list: dict = {
+        _ULTRASONIC_ID: (0x01, 2, 'big', 0xffff,		# 53.  0x35  PiicoDev 'smart module' WHOAMI
+            ((578, _MAIN), (379, _CONF), (411, _CONF)), None),		#  ultrasonic, potentiometer (rotary/slide)
+        _TMP117_ID: (0x0f, 2, 'big', 0x0fff,			# 72.  0x48  TMP117 device ID register
+            ((0x117, _MAIN),), _CONF),							#  anything else answering is the VEML6030
+        _RV3028_ID: (0x00, 2, 'little', 0xffff,		# 82.  0x52  ENS160 PART_ID register
+            ((0x160, _CONF),), _MAIN),							#  the RV3028 reads back its seconds/minutes
     }
 
     #
     # PiicoDev defaults pre-defined
     # can be overloaded with other values if needed to establish a second/alternate i2c bus
     #
-    def __init__(self, id=0, scl=Pin(9), sda=Pin(8), freq=400_000):
-        self.i2c = I2C(id=id, scl=scl, sda=sda, freq=freq)
-        self.connected = self.i2c.scan()
+    # targeted=True only probes the catalogued ID's (or the given probe_set) instead of
+    #  sweeping the whole bus with i2c.scan()
+    # lazy=True doesn't open or scan the bus until connected, is_ID_connected() or details() are
+    #  first used, or prefetch() is called
+    # scl/sda default to Pin(9)/Pin(8), these are only created when the bus is opened
+    # i2c=<bus> uses an already open i2c bus (or a stand-in with the same methods) instead
+    # instrument=True records probe and scan statistics, see stats()
+    # autofreq=True runs the bus at the fastest reliable frequency found by calibrate(), calibrating
+    #  on the first scan unless this bus was already calibrated
+    # cache='<file>' saves the connected ID's, and the first scan only verifies those ID's if the file
+    #  is still valid for this bus, see save_topology()
+    # shared=True shares the i2c bus object and the scan result with every other shared instance on the
+    #  same bus (id, scl, sda, freq) with the same scan mode (targeted, probe set), only the first one to
+    #  need it opens and scans the bus
+    #
+    def __init__(self, id=0, scl=None, sda=None, freq=400_000, targeted=False, probe_set=None, extlist=None, lazy=False, i2c=None, instrument=False, autofreq=False, cache=None, shared=False):
+        self.id = id
+        self.freq = freq
+        self._freq = freq           # as requested, self.freq is the one in use
+        self._scl = scl
+        self._sda = sda
+        self._i2c = i2c
+        # identifies the bus for the frequency cache, the bus object itself if one was given
+        self._key = (id, 9 if scl == None else scl, 8 if sda == None else sda) if i2c == None else (i2c,)
+        self.autofreq = autofreq
+        self.cache = cache
+        self.from_cache = 0
+        self._snapshot = None
+        self._identified = (0, {})  # (generation, {ID: dictionary}) of identify()
+        self.generation = 0
+        self._lock = None           # serialises the scans once a background scanner runs
+        self._scanning = False
+        self._scanner_running = False
+        self.scanner_error = None
+        self.targeted = targeted
+        self.set_probe(probe_set, extlist)
+        self._shared = None
+        self._shared_gen = 0
+        if shared:
+            # the scan result is only shared with instances that would scan the same way
+            key = self._key + (freq, targeted, tuple(self.probe_set) if targeted else ())
+            if key not in self._buses:
+                self._buses[key] = _Shared_bus()
+            self._shared = self._buses[key]
+        if autofreq and self._key in self._freq_cache:
+            self._set_freq(self._freq_cache[self._key])
+        self._callbacks = {}
+        self._drivers = {}
+        self._factories = {}
+        self._ext = None
+        self._ext_len = 0
+        self._ext_index = None
+        self._ext_ids = ()
+        self._ext_ambiguity = None
+        self._report = None         # allocated by the first report, see report
+        self._acks = None
+        if instrument:
+            self.instrument()
+        if not lazy:
+            self.prefetch()
+
+    # the i2c bus, opened on first use
+    @property
+    def i2c(self):
+        if self._i2c == None:
+            shared = self._shared
+            if shared != None and shared.i2c != None:
+                self._i2c = shared.i2c
+                return self._i2c
+            if self._scl == None:
+                self._scl = Pin(9)
+            if self._sda == None:
+                self._sda = Pin(8)
+            self._i2c = I2C(id=self.id, scl=self._scl, sda=self._sda, freq=self.freq)
+            if shared != None:
+                shared.i2c = self._i2c
+        return self._i2c
+
+    # the Piico_report of show_int(), details() ..., only allocated by the first report, so instances
+    #  that never print (lazy, shared, Piico_busset, Piico_fleet) don't each hold a 1 KB buffer
+    @property
+    def report(self):
+        if self._report == None:
+            self._report = Piico_report()
+        return self._report
+
+    @report.setter
+    def report(self, value):
+        self._report = value
+
+    # the list of connected ID's, scanned on first use
+    @property
+    def connected(self):
+        return self.snapshot().connected
+
+    # snapshot() - returns the current Piico_snapshot (generation, connected, present), scanned on first use
+    #  a snapshot never changes, a rescan swaps in a new one once it is complete
+    def snapshot(self):
+        snap = self._snapshot
+        if snap == None or (self._shared != None and self._shared_gen != self._shared.generation):
+            self._ready()
+            snap = self._snapshot
+        return snap
+
+    # pick up a newer shared scan, or do the first scan
+    def _ready(self):
+        if self._shared != None and self._shared_gen != self._shared.generation:
+            self._adopt()
+        if self._snapshot == None:
+            self.prefetch()
+
+    # take the shared scan result, firing this instance's callbacks for any change
+    def _adopt(self):
+        shared = self._shared
+        self._shared_gen = shared.generation
+        if shared.connected == None:    # invalidated, the next use scans
+            self._snapshot = None
+            return
+        previous = self._snapshot
+        self.connected = shared.connected
+        if previous != None:
+            self._changes(previous.connected, shared.connected)
+
+    # give this scan result to the other shared instances
+    def _publish(self):
+        shared = self._shared
+        if shared != None:
+            shared.connected = self._snapshot.connected
+            shared.generation += 1
+            self._shared_gen = shared.generation
+
+    # invalidate() - forgets the scan result, the next use scans again (once for all shared instances)
+    def invalidate(self):
+        self._snapshot = None
+        shared = self._shared
+        if shared != None:
+            shared.connected = None
+            shared.generation += 1
+            self._shared_gen = shared.generation
+
+    # every new list is a new snapshot with the next scan generation, what identify() found is forgotten
+    #  the list is also kept as a 128 bit presence bitmap, bit (id & 7) of byte (id >> 3)
+    #  the snapshot is built first and swapped in with the one assignment
+    @connected.setter
+    def connected(self, value):
+        present = bytearray(16)
+        for i in value:
+            if 0 <= i < 128:
+                present[i >> 3] |= 1 << (i & 7)
+        generation = self.generation + 1
+        self._snapshot = Piico_snapshot(generation, value, bytes(present))
+        self.generation = generation
+
+    # swap in the snapshot of a new scan, returns the previous list
+    def _swap(self, found):
+        snap = self._snapshot
+        self.connected = found
+        self._publish()
+        return snap.connected if snap != None else []
+
+    # prefetch() - opens the i2c bus and does the first scan now (if not done already)
+    def prefetch(self):
+        if self._shared != None and self._shared_gen != self._shared.generation:
+            self._adopt()
+        if self._snapshot == None:
+            if _Debug == 1:
+                print('prefetch()')
+            found = self._verify_topology() if self.cache != None else None
+            self.from_cache = 1 if found != None else 0
+            if found == None:
+                self._autocalibrate()
+                found = self.scan()
+                if self.cache != None:
+                    self.save_topology(found)
+            self.connected = found
+            self._publish()
+
+    # save_topology() - saves the connected ID's and the bus frequency to the cache file, with a fingerprint
+    #  of the bus setup. A warm start only probes the saved ID's (at the saved frequency with autofreq,
+    #  without calibrating), and does a full scan if the fingerprint doesn't match or any of them
+    #  doesn't answer. rescan() and calibrate() save again whenever the list or frequency changes
+    def save_topology(self, ids=None):
+        if ids == None:
+            ids = self.connected
+        ids = ','.join(['%x' % i for i in ids])
+        try:
+            with open(self.cache, 'w') as f:
+                f.write('%08x %s %d\n' % (self._fingerprint(ids, self.freq), ids, self.freq))
+        except OSError:
+            if _Debug == 1:
+                print('save_topology() failed', self.cache)
+
+    # forget_topology() - deletes the cache file, the next start does a full scan
+    def forget_topology(self):
+        import os
+        try:
+            os.remove(self.cache)
+        except OSError:
+            pass
+
+    # the saved ID's if the cache file is valid for this bus and they all still answer, otherwise None
+    #  with autofreq the saved (calibrated) frequency is used, and kept as this bus's calibration
+    def _verify_topology(self):
+        try:
+            with open(self.cache) as f:
+                fingerprint, ids, freq = f.readline().split(' ')
+            freq = int(freq)
+            if int(fingerprint, 16) != self._fingerprint(ids, freq):
+                return None
+            found = [int(i, 16) for i in ids.split(',')] if ids else []
+        except (OSError, ValueError):
+            return None
+        calibrated = self.autofreq and self._key not in self._freq_cache
+        if calibrated and freq != self.freq and not self._set_freq(freq):
+            return None
+        for i in found:
+            if not self.probe(i):
+                if _Debug == 1:
+                    print('_verify_topology()', hex(i), 'missing, rescanning')
+                return None
+        if calibrated:
+            self._freq_cache[self._key] = freq
+        return found
+
+    # FNV-1a hash of the bus setup, the saved ID's and frequency, any change of bus, frequency (the
+    #  requested one, or autofreq), scan mode or dictionaries invalidates the cache file
+    def _fingerprint(self, ids, freq):
+        text = '%d %s %d %s %s %s %s %d' % (self.id, 'auto' if self.autofreq else self._freq, self.targeted,
+                                           self.probe_set if self.targeted else '',
+                                           sorted(self.PiicoDev_list), sorted(self.PiicoDev_conf_list), ids, freq)
+        return _fnv1a(text)
+
+    # calibrate() - finds and sets the fastest frequency the bus scans reliably at, returns it
+    #  the first (slowest) step of the ladder gives the reference scan, each faster step must
+    #  match it repeats times in a row. The result is cached for this bus (id, scl, sda)
+    #  calibrate((100_000, 400_000), 5) - try only these frequencies, 5 scans each
+    def calibrate(self, ladder=None, repeats=3):
+        ladder = sorted(ladder if ladder != None else self._freq_ladder)
+        if not self._set_freq(ladder[0]):
+            return self.freq    # a given bus without init(freq=...), can't be changed
+        reference = self.scan()
+        best = ladder[0]
+        for freq in ladder[1:]:
+            self._set_freq(freq)
+            stable = 1
+            for _ in range(repeats):
+                if self.scan() != reference:
+                    stable = 0
+                    break
+            if _Debug == 1:
+                print('calibrate()', freq, 'stable' if stable else 'unreliable')
+            if not stable:
+                break
+            best = freq
+        self._set_freq(best)
+        self._freq_cache[self._key] = best
+        if self.cache != None and self._snapshot != None:
+            self.save_topology()
+        return best
+
+    # with autofreq, calibrate() the bus before its first scan unless it is calibrated already
+    #  used by prefetch(), rescan() and rescan_async(), whichever scans first
+    def _autocalibrate(self):
+        if self.autofreq and self._key not in self._freq_cache:
+            self.calibrate()
+
+    # change the bus frequency, reopening the bus (or init() of a given bus), returns 0 if it can't
+    def _set_freq(self, freq):
+        if self._key[0] is self._i2c:
+            try:
+                self._i2c.init(freq=freq)
+            except (AttributeError, TypeError):
+                return(0)
+        else:
+            self._i2c = None    # reopened at the new frequency on next use
+            if self._shared != None:
+                self._shared.i2c = None
+        self.freq = freq
+        return(1)
         
     # clear() - clears the list of connected i2c devices
     def clear(self):
         self.connected = []
         
-    # rescan() - clears and rescans the default i2c bus and repopulates the list
-    def rescan(self):
-        self.connected = []
-        self.connected = self.i2c.scan()
+    # rescan() - rescans the default i2c bus and replaces the list
+    #  rescan(True) forces a full sweep even in targeted mode
+    #  returns (added, removed) lists of ID's compared to the list before the rescan
+    #  the old list stays in place until the new scan is complete, see snapshot()
+    def rescan(self, full=False):
+        lock = self._lock
+        if lock == None:
+            self._autocalibrate()
+            found = self.scan(full)
+            previous = self._swap(found)
+        else:
+            with lock:
+                self._autocalibrate()
+                found = self.scan(full)
+                previous = self._swap(found)
+        return self._changes(previous, found)
+
+    # start_scanner(period_ms, full) - rescans every period_ms on a second thread (the second core on the RP2040)
+    #  the callbacks are called on that thread. Returns 1 if started (or already running), 0 without _thread
+    #  a scanner that is still stopping is waited for, there is only ever one scanner thread
+    #  (the RP2040 only has the one spare core, so not together with Piico_busset.scan())
+    def start_scanner(self, period_ms=1000, full=False):
+        if _thread == None:
+            return(0)
+        if self._lock == None:
+            self._lock = _thread.allocate_lock()
+        if self._scanner_running and self._scanning:
+            return(1)
+        while self._scanner_running:    # the previous scanner hasn't exited yet
+            time.sleep(0.001)
+        self.snapshot()     # the first scan on this thread, so the readers have a list
+        self.scanner_error = None
+        self._scanning = True
+        self._scanner_running = True
+        _thread.start_new_thread(self._scanner, (period_ms, full))
+        return(1)
+
+    # stop_scanner() - stops the background scanner after its current rescan
+    def stop_scanner(self):
+        self._scanning = False
+
+    # the background scanner thread, stops on anything but a bus error (kept in scanner_error)
+    def _scanner(self, period_ms, full):
+        try:
+            while self._scanning:
+                try:
+                    self.rescan(full)
+                except OSError:     # a bus error, try again next time
+                    pass
+                wait = period_ms
+                while wait > 0 and self._scanning:
+                    time.sleep(min(wait, 10) / 1000)
+                    wait -= 10
+        except Exception as e:
+            self.scanner_error = e
+        finally:
+            self._scanning = False
+            self._scanner_running = False
+
+    # rescan_async() - coroutine version of rescan(), for asyncio/uasyncio tasks
+    #  probes batch ID's at a time and yields to the other tasks in between, same result as rescan()
+    #  e.g.  added, removed = await tests.rescan_async(False, 4)
+    #  with autofreq an uncalibrated bus is calibrated first, that doesn't yield
+    async def rescan_async(self, full=False, batch=8):
+        self._autocalibrate()
+        found = await self.scan_async(full, batch)
+        lock = self._lock
+        if lock == None:
+            previous = self._swap(found)
+        else:
+            with lock:
+                previous = self._swap(found)
+        return self._changes(previous, found)
+
+    # scan_async() - coroutine version of scan(), probes batch ID's at a time and yields in between
+    #  a full sweep probes the same 0x08 - 0x77 range as i2c.scan()
+    async def scan_async(self, full=False, batch=8):
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        if self.targeted and not full:
+            ids = self.probe_set
+        else:
+            ids = range(_SCAN_FIRST, _SCAN_LAST + 1)
+        found = []
+        n = 0
+        for i in ids:
+            if self.probe(i):
+                found.append(i)
+            n += 1
+            if n >= batch:
+                n = 0
+                await asyncio.sleep(0)
+        return found
+
+    # the (added, removed) ID's of the new list compared to previous, and fire the callbacks
+    def _changes(self, previous, current):
+        added = [i for i in current if i not in previous]
+        removed = [i for i in previous if i not in current]
+        if self.cache != None and (added or removed):
+            self.save_topology()
+        for i in removed:
+            if i in self._drivers:
+                del self._drivers[i]
+        if _Debug == 1:
+            print('rescan() added', added, 'removed', removed)
+        self._notify(added, removed)
+        return(added, removed)
+
+    # on_change(callback) - registers callback(id, attached) that rescan() calls for each ID that
+    #  attaches (attached == 1) or detaches (attached == 0). on_change(callback, id) only for that ID
+    def on_change(self, callback, id=None):
+        if id in self._callbacks:
+            self._callbacks[id].append(callback)
+        else:
+            self._callbacks[id] = [callback]
+
+    # remove_callback(callback) - unregisters a callback registered by on_change() (with the same id)
+    def remove_callback(self, callback, id=None):
+        if id in self._callbacks and callback in self._callbacks[id]:
+            self._callbacks[id].remove(callback)
+            if len(self._callbacks[id]) == 0:
+                del self._callbacks[id]
+
+    # fire the registered callbacks for the attached and detached ID's
+    def _notify(self, added, removed):
+        if len(self._callbacks) == 0:
+            return
+        every = self._callbacks.get(None, ())
+        for attached, ids in ((1, added), (0, removed)):
+            for i in ids:
+                for callback in self._callbacks.get(i, ()):
+                    callback(i, attached)
+                for callback in every:
+                    callback(i, attached)
+
+    # set_probe() - sets the ID's probed by a targeted scan
+    #  default is every ID in the main and conflict dictionaries, plus the keys of extlist if given
+    def set_probe(self, probe_set=None, extlist=None):
+        if probe_set == None:
+            probe_set = set(self.PiicoDev_list)
+            probe_set.update(self.PiicoDev_conf_list)
+            if extlist != None:
+                probe_set.update(extlist)
+        self.probe_set = sorted(probe_set)
+
+    # scan() - returns the list of ID's that answer, in ascending order like i2c.scan()
+    #  targeted mode only addresses the probe set, scan(True) falls back to a full sweep
+    #  when instrumented a full sweep also probes one ID at a time, to record each of them
+    def scan(self, full=False):
+        if self._acks == None:
+            if self.targeted and not full:
+                if _Debug == 1:
+                    print('scan() targeted', len(self.probe_set), 'probes')
+                return [i for i in self.probe_set if self.probe(i)]
+            return self.i2c.scan()
+        start = ticks_us()
+        if self.targeted and not full:
+            found = [i for i in self.probe_set if self.probe(i)]
+        else:
+            found = [i for i in range(_SCAN_FIRST, _SCAN_LAST + 1) if self.probe(i)]
+        self._record_scan(ticks_diff(ticks_us(), start))
+        return found
+
+    # probe(id) - returns 1 if a device acknowledges the ID, otherwise 0
+    #  same zero length write that i2c.scan() uses for each address
+    def probe(self, id):
+        if self._acks != None:
+            return self._probe_recorded(id)
+        try:
+            self.i2c.writeto(id, b'')
+            return(1)
+        except OSError:
+            return(0)
+
+    # instrument() - starts recording per ID probe latency, ACK/NACK/error counts and scan durations
+    #  instrument(False) stops. The counters are allocated once here, recording doesn't allocate
+    def instrument(self, on=True):
+        if not on:
+            self._acks = None
+            return
+        if self._acks == None:
+            self._acks = array('L', [0] * 128)
+            self._nacks = array('L', [0] * 128)
+            self._errors = array('L', [0] * 128)
+            self._probe_us = array('L', [0] * 128)    # total
+            self._probe_max = array('L', [0] * 128)
+            self._scan_hist = array('L', [0] * _HIST_BUCKETS)
+            self._scan_us = array('L', [0] * 3)        # count, total, max
+        else:
+            self.reset_stats()
+
+    # reset_stats() - zeroes the instrumentation counters
+    def reset_stats(self):
+        if self._acks == None:
+            return
+        for counters in (self._acks, self._nacks, self._errors, self._probe_us, self._probe_max,
+                         self._scan_hist, self._scan_us):
+            for n in range(len(counters)):
+                counters[n] = 0
+
+    # stats() - returns the instrumentation counters, None if not instrumented
+    #  {'scans': count, 'scan_us': total, 'scan_us_max': longest,
+    #   'scan_hist': [count of scans taking < 2**n us, ...],
+    #   'ids': {ID: (acks, nacks, errors, mean probe us, max probe us), ...} for every ID probed}
+    def stats(self):
+        if self._acks == None:
+            return None
+        ids = {}
+        for i in range(128):
+            n = self._acks[i] + self._nacks[i] + self._errors[i]
+            if n:
+                ids[i] = (self._acks[i], self._nacks[i], self._errors[i],
+                          self._probe_us[i] // n, self._probe_max[i])
+        return {'scans': self._scan_us[0], 'scan_us': self._scan_us[1], 'scan_us_max': self._scan_us[2],
+                'scan_hist': list(self._scan_hist), 'ids': ids}
+
+    # probe one ID, recording the latency and the result
+    def _probe_recorded(self, id):
+        start = ticks_us()
+        try:
+            self.i2c.writeto(id, b'')
+            result = 1
+        except OSError as e:
+            result = 0
+            if e.args[0] in _NACK_ERRNO:
+                self._nacks[id] += 1
+            else:
+                self._errors[id] += 1
+        if result:
+            self._acks[id] += 1
+        us = ticks_diff(ticks_us(), start)
+        self._probe_us[id] += us
+        if us > self._probe_max[id]:
+            self._probe_max[id] = us
+        return result
+
+    # add a scan duration to the histogram, bucket n counts scans taking less than 2**n us
+    def _record_scan(self, us):
+        bucket = 0
+        n = us
+        while n and bucket < _HIST_BUCKETS - 1:
+            n >>= 1
+            bucket += 1
+        self._scan_hist[bucket] += 1
+        self._scan_us[0] += 1
+        self._scan_us[1] += us
+        if us > self._scan_us[2]:
+            self._scan_us[2] = us
     
     # show_int() - prints the list of connected ID's in DECIMAL detected by the original/most recent scan
-    def show_int(self):
-        print(self.connected)
+    #  returns the list
+    def show_int(self, stream=None):
+        report = self.report
+        report.reset()
+        report.line(str(self.connected))
+        report.write(stream)
+        return self.connected
     
     # show_hex() - prints the list of connected ID's in HEXADECIMAL detected by the original/most recent scan
-    def show_hex(self):
-        print( [hex(i) for i in self.connected] )
+    #  returns the list of hex strings
+    def show_hex(self, stream=None):
+        ids = [hex(i) for i in self.connected]
+        report = self.report
+        report.reset()
+        report.line(str(ids))
+        report.write(stream)
+        return ids
 
     # is_ID_connected(id) - returns 1 if the ID is in the list, otherwise 0
     def is_ID_connected(self, id):
         if _Debug == 1:
             print('is_ID_connected(',id,')')
-        if self.connected.count(id) == 1:
-            return(1)
-        else:
-            return(0)
+        return _has(self.snapshot(), id)
+
+    # are_connected(ids) - returns a tuple of 1/0 for each of the ID's, in the same order
+    def are_connected(self, ids):
+        return tuple([self.is_ID_connected(i) for i in ids])
+
+    # connected_mask(ids) - returns an int with bit n set if ids[n] is connected
+    def connected_mask(self, ids):
+        snap = self.snapshot()
+        mask = 0
+        for n in range(len(ids)):
+            if _has(snap, ids[n]):
+                mask |= 1 << n
+        return mask
+
+    # missing(expected) - returns the list of expected ID's that are not connected
+    def missing(self, expected):
+        return [i for i in expected if not self.is_ID_connected(i)]
+
+    # unexpected(expected) - returns the list of connected ID's that are not in expected
+    def unexpected(self, expected):
+        return [i for i in self.connected if i not in expected]
+
+    # presence() - returns the connected ID's as a 128 bit int, bit n set if ID n is connected
+    def presence(self):
+        return int.from_bytes(self.snapshot().present, 'little')
     
+    # identify(id) - returns the dictionary entry of the device actually at a connected ID, otherwise None
+    #  conflicting ID's are resolved by reading the device's ID register, once per scan generation
+    #  None is also returned for a conflict that can't be resolved
+    def identify(self, id):
+        which = self._which(id)
+        if which == _MAIN:
+            return self.PiicoDev_list[id]
+        if which == _CONF:
+            return self.PiicoDev_conf_list[id]
+        return None
+
+    # is_device_connected(short_name) - returns 1 if a device with that 'short_name' is identified, otherwise 0
+    #  e.g. is_device_connected('Potentiometer') is only 1 if the device at 0x35 reports as a potentiometer
+    def is_device_connected(self, short_name):
+        for i in self.connected:
+            entry = self.identify(i)
+            if entry != None and entry['short_name'] == short_name:
+                return(1)
+        return(0)
+
+    # driver(id) - returns the PiicoDev driver of the device at a connected ID, None if there isn't one
+    #  the driver module (the 'initme' entry, 'module.factory') is only imported now, and is created on
+    #  this i2c bus object with the ID as its address, then kept until the device detaches.
+    #  Conflicting ID's use the device found by identify(), None if that can't be resolved.
+    #  driver(id, ...) passes any extra keyword arguments to the driver, e.g. driver(0x77, iir=2)
+    def driver(self, id, **kwargs):
+        if id in self._drivers:
+            return self._drivers[id]
+        if not self.is_ID_connected(id):
+            return None
+        if id in self._factories:
+            drv = self._factories[id](self.i2c, id, **kwargs)
+        else:
+            entry = self.identify(id)
+            if entry == None or 'initme' not in entry:
+                return None
+            module, factory = entry['initme'].rsplit('.', 1)
+            if _Debug == 1:
+                print('driver(', hex(id), ')', module, factory)
+            drv = self._on_this_bus(getattr(__import__(module), factory), id, kwargs)
+        self._drivers[id] = drv
+        return drv
+
+    # create a PiicoDev_Unified driver on this i2c bus object. PiicoDev_Unified builds its bus with
+    #  machine.I2C(), so for the driver's __init__ that name hands back this bus instead of a second
+    #  I2C on the same peripheral. It only does that when given bus, sda and scl together, so the pins
+    #  in use are passed as well (the default pin numbers for a bus given as i2c=, they aren't used).
+    #  Most drivers take the ID as address=, some (TMP117, VEML6030 ...) addr=
+    def _on_this_bus(self, factory, id, kwargs):
+        bus = self.i2c
+        if 'scl' not in kwargs:     # kwargs is driver()'s own dictionary
+            kwargs['scl'] = 9 if self._scl == None else self._scl
+        if 'sda' not in kwargs:
+            kwargs['sda'] = 8 if self._sda == None else self._sda
+        unified = sys.modules.get('PiicoDev_Unified')
+        machine_i2c = getattr(unified, 'I2C', None)
+        if machine_i2c != None:
+            unified.I2C = lambda *args, **kw: bus
+        try:
+            try:
+                return factory(bus=self.id, freq=self.freq, address=id, **kwargs)
+            except TypeError:
+                return factory(bus=self.id, freq=self.freq, addr=id, **kwargs)
+        finally:
+            if machine_i2c != None:
+                unified.I2C = machine_i2c
+
+    # drivers() - creates the drivers of all the connected devices, returns {ID: driver}
+    #  devices without a driver, whose driver module isn't installed or doesn't take these arguments, are left out
+    def drivers(self):
+        for i in self.connected:
+            try:
+                self.driver(i)
+            except (ImportError, TypeError):
+                if _Debug == 1:
+                    print('drivers() no usable driver for', hex(i))
+        return dict(self._drivers)
+
+    # set_driver(id, factory) - use factory(i2c, id, **kwargs) to create the driver for an ID,
+    #  e.g. for a device from the external dictionary, the factory gets this i2c bus object
+    def set_driver(self, id, factory):
+        self._factories[id] = factory
+        if id in self._drivers:
+            del self._drivers[id]
+
+    # which dictionary (_MAIN, _CONF) holds the device at a connected ID, None if unknown/unresolved
+    def _which(self, id):
+        snap = self.snapshot()
+        cache = self._identified
+        if cache[0] != snap.generation:
+            cache = (snap.generation, {})
+            self._identified = cache
+        identified = cache[1]
+        if id in identified:
+            return identified[id]
+        if not _has(snap, id):
+            return None
+        which = None
+        if id in self.PiicoDev_conf_list:
+            if id in self._identify_list:
+                which = self._read_which(id, self._identify_list[id])
+            elif id not in self.PiicoDev_list:
+                which = _CONF
+        elif id in self.PiicoDev_list:
+            which = _MAIN
+        if _Debug == 1:
+            print('identify(', id, ') ->', which)
+        identified[id] = which
+        return which
+
+    # read the ID register of a conflicting device and look the value up
+    def _read_which(self, id, test):
+        register, size, order, mask, values, otherwise = test
+        try:
+            value = int.from_bytes(self.i2c.readfrom_mem(id, register, size), order) & mask
+        except OSError:
+            return None
+        for match, which in values:
+            if value == match:
+                return which
+        return otherwise
+
     # how_many_connected() - returns count of detected ID's
     def how_many_connected(self):
         if _Debug == 1:
@@ -326,104 +1343,352 @@ class Piico_info(object):
         return(len(self.connected))
 
     # details() - prints various levels of information of the connected ID's
-    def details(self, mode='what', extlist=None):
+    #  details(mode, extlist, True) only prints the identified device of a resolved conflict
+    #  returns the list of records (see lookup())
+    def details(self, mode='what', extlist=None, resolve=False, stream=None):
         if _Debug == 1:
             print('details(',mode,')')
-        if len(self.connected) == 0:
-            print('Nothing connected')
-        else:
-            for i in self.connected:
-                hit = 0
-                if i in self.PiicoDev_list:
-                    self.print_main(i, mode)
-                    hit = 1
-                if i in self.PiicoDev_conf_list:
-                    print('   vvv Possible conflict vvv')
-                    self.print_conf(i, mode)
-                    hit = 1
-                if extlist != None:
-                    if i in extlist:
-                        print('   vvv EXTERNAL LIST --- Possible conflict vvv')
-                        if mode == 'long':
-                            s = extlist[i]['long_name']
-                        elif mode == 'short':
-                            s = extlist[i]['short_name']
-                        else:   # assume 'what'
-                            s = extlist[i]['what']
-                        print(i, hex(i), s)
-                        hit = 1
-                if hit == 0:
-                    print('Unknown device at ID ', i)
+        records = self.lookup(extlist, resolve)
+        key = self._keys.get(mode, 'what')
+        report = self.report
+        report.reset()
+        if len(records) == 0:
+            report.line('Nothing connected')
+        last = None
+        for r in records:
+            if r.source == None:
+                report.line('Unknown device at ID  %d' % r.id)
+            else:
+                if r.source == _EXT:
+                    report.line('   vvv EXTERNAL LIST --- Possible conflict vvv')
+                elif r.id == last:
+                    report.line('   vvv Possible conflict vvv')
+                report.entry(r.id, getattr(r, key))
+            last = r.id
+        report.write(stream)
+        return records
 
     # what_is(id) - prints various levels of information from the dictionaries of the given ID
-    def what_is(self, id, mode='what', extlist=None):
+    #  returns the list of records (see lookup())
+    def what_is(self, id, mode='what', extlist=None, stream=None):
+        records = self.lookup_id(id, extlist)
+        key = self._keys.get(mode, 'what')
+        report = self.report
+        report.reset()
         hit = 0
-        if id in self.PiicoDev_list:
-            self.print_main(id, mode)
-            hit = 1  # found it here
-        if id in self.PiicoDev_conf_list:
-            if hit == 1:  # have we already found it?
-                print('   vvv Possible conflict vvv')
-            self.print_conf(id, mode)
-            hit = 1 # set this so so we can test for external conflicts also
-        if extlist != None:
-            if id in extlist:
-                if hit == 1:  # have we already found it at least once?
-                    print('   vvv Possible EXTERNAL conflict vvv')
-                self.print_ext(id, mode, extlist)
-                hit = 1 # set this so we don't trigger the next line
-        if hit == 0:
-            print('Unknown ID ', id)
+        for r in records:
+            if r.source == None:
+                report.line('Unknown ID  %d' % id)
+                break
+            if hit == 1:  # have we already found it at least once?
+                if r.source == _EXT:
+                    report.line('   vvv Possible EXTERNAL conflict vvv')
+                else:
+                    report.line('   vvv Possible conflict vvv')
+            report.entry(id, getattr(r, key))
+            hit = 1
+        report.write(stream)
+        return records
 
     # show_all() - prints various levels of information from the main/conflict internal dictonaries
-    def show_all(self, mode='what', conf=None, extlist=None ):
-        for i in sorted(self.PiicoDev_list):
-            self.print_main(i, mode)
-        if conf != None:
-            print('-- conflicting --')
-            for i in sorted(self.PiicoDev_conf_list):
-                self.print_conf(i, mode)
-        if extlist != None:
-            print('-- external list --')
-            for i in sorted(extlist):
-                self.print_ext(i,mode,extlist)
+    #  returns the list of records (see lookup())
+    def show_all(self, mode='what', conf=None, extlist=None, stream=None):
+        records = self.lookup_all(conf, extlist)
+        key = self._keys.get(mode, 'what')
+        report = self.report
+        report.reset()
+        headers = (None,
+                   '-- conflicting --' if conf != None else None,
+                   '-- external list --' if extlist != None else None)
+        section = _MAIN
+        for r in records + [Piico_record(None, _EXT + 1, None, None, None, ())]:
+            while section < r.source:   # header of each section, even an empty one
+                section += 1
+                if section <= _EXT and headers[section] != None:
+                    report.line(headers[section])
+            if r.id != None:
+                report.entry(r.id, getattr(r, key))
+        report.write(stream)
+        return records
+
+    # lookup() - returns a list of records for the connected ID's, without printing anything
+    #  each record is a Piico_record(id, source, what, short_name, long_name, group)
+    #   source is 0 main, 1 conflicts, 2 external dictionary, None for an unknown device
+    #   group is the 'short_name' of every possible device at that ID, empty if there is no conflict
+    #  lookup(extlist, True) only returns the identified device of a resolved conflict
+    def lookup(self, extlist=None, resolve=False):
+        index = self._lookup(extlist)
+        records = []
+        for i in self.connected:
+            if i not in index:
+                records.append(Piico_record(i, None, None, None, None, ()))
+                continue
+            candidates = index[i]
+            if resolve:
+                which = self._which(i)
+                if which != None:
+                    candidates = tuple([c for c in candidates if c[0] == which or c[0] == _EXT])
+            self._records(i, candidates, records)
+        return records
+
+    # lookup_id(id) - returns a list of records for the given ID, without printing anything
+    def lookup_id(self, id, extlist=None):
+        index = self._lookup(extlist)
+        if id not in index:
+            return [Piico_record(id, None, None, None, None, ())]
+        return self._records(id, index[id], [])
+
+    # lookup_all() - returns a list of records for the main (and conflicts/external) dictionaries
+    def lookup_all(self, conf=None, extlist=None):
+        index = self._lookup(extlist)
+        records = []
+        for source, ids, table in ((_MAIN, self._main_ids, self.PiicoDev_list),
+                                   (_CONF, self._conf_ids if conf != None else (), self.PiicoDev_conf_list),
+                                   (_EXT, self._ext_ids if extlist != None else (), extlist)):
+            for i in ids:
+                e = table[i]
+                records.append(Piico_record(i, source, e['what'], e['short_name'], e['long_name'],
+                                            self._group(i, index[i])))
+        return records
+
+    # append the records of the (source, dictionary) candidates of an ID
+    def _records(self, id, candidates, records):
+        group = self._group(id, candidates)
+        for source, table in candidates:
+            e = table[id]
+            records.append(Piico_record(id, source, e['what'], e['short_name'], e['long_name'], group))
+        return records
+
+    # the 'short_name' of every candidate, empty if there is only one
+    def _group(self, id, candidates):
+        if len(candidates) < 2:
+            return ()
+        return tuple([table[id]['short_name'] for source, table in candidates])
+
+    # _lookup(extlist) - returns the merged index of the main, conflict and external dictionaries
+    #  {ID: ((source, dictionary), ...)} in main, conflict, external order, more than one entry is a conflict
+    #  the internal part is built once per class, the external part only when a different extlist is given
+    def _lookup(self, extlist=None):
+        cls = type(self)
+        if cls._base_index == None:
+            index = {}
+            for source, table in ((_MAIN, cls.PiicoDev_list), (_CONF, cls.PiicoDev_conf_list)):
+                for i in table:
+                    index[i] = index.get(i, ()) + ((source, table),)
+            cls._base_index = index
+            cls._main_ids = tuple(sorted(cls.PiicoDev_list))
+            cls._conf_ids = tuple(sorted(cls.PiicoDev_conf_list))
+        if extlist == None:
+            return cls._base_index
+        if extlist is not self._ext or len(extlist) != self._ext_len:
+            if _Debug == 1:
+                print('_lookup() indexing', len(extlist), 'external entries')
+            index = dict(cls._base_index)
+            entry = ((_EXT, extlist),)
+            for i in extlist:
+                index[i] = index.get(i, ()) + entry
+            self._ext = extlist
+            self._ext_len = len(extlist)
+            self._ext_index = index
+            self._ext_ids = tuple(sorted(extlist))
+        return self._ext_index
+
+    # conflicts(extlist) - returns the sorted list of ID's with more than one possible device
+    def conflicts(self, extlist=None):
+        index = self._lookup(extlist)
+        return sorted([i for i in index if len(index[i]) > 1])
+
+    # solve(bom, extlist, resolve, limit) - returns the possible assignments of modules to the connected ID's
+    #  a list of Piico_assignment, best first, at most limit of them
+    #  every catalogued connected ID is given one of its possible devices, so a module can be at its
+    #  default address or at its ASW alternate. Ranked by the mismatch against the bill of materials
+    #  (bom, {module: count} or a list of modules, the short_name without the ASW setting), then by how
+    #  many devices are not the first (default) choice of their ID
+    #  with a bom an ID is only given more copies of a bom module than the bom allows if none of its
+    #  devices fit, modules that aren't in the bom are allowed (and counted as extra)
+    #  resolve=True reads the ID registers of the conflicting ID's first, see identify()
+    def solve(self, bom=None, extlist=None, resolve=False, limit=8):
+        table = self._ambiguity(self._lookup(extlist))
+        if bom != None and not isinstance(bom, dict):
+            counts = {}
+            for m in bom:
+                counts[m] = counts.get(m, 0) + 1
+            bom = counts
+        fixed = []
+        ambiguous = []
+        for i in self.connected:
+            if i not in table:
+                continue
+            candidates = table[i]
+            if resolve and len(candidates) > 1:
+                which = self._which(i)
+                if which != None:
+                    candidates = tuple([c for c in candidates if c[0] == which])
+            if len(candidates) == 1:
+                fixed.append((i, candidates[0]))
+            else:
+                ambiguous.append((i, candidates))
+        if limit < 1:
+            return []
+        # the modules placed so far, and how far they are short of (missing) or beyond (extra) the bom
+        counts = {}
+        missing = sum(bom.values()) if bom != None else 0
+        extra = 0
+        for i, c in fixed:
+            m = c[2]
+            if bom != None:
+                if counts.get(m, 0) < bom.get(m, 0):
+                    missing -= 1
+                else:
+                    extra += 1
+            counts[m] = counts.get(m, 0) + 1
+        # depth first through the ambiguous ID's, keeping the best limit assignments and pruning every
+        #  branch that can't beat the worst of them. The devices of bom modules are tried first (to find
+        #  a low mismatch early), otherwise the first (preferred) device first
+        kept = []
+        n = len(ambiguous)
+        order = []
+        fillable = [0] * (n + 1)    # how many of the ID's from here on could be a bom module
+        for d in range(n - 1, -1, -1):
+            candidates = ambiguous[d][1]
+            first = [k for k in range(len(candidates)) if bom != None and candidates[k][2] in bom]
+            order.insert(0, first + [k for k in range(len(candidates)) if k not in first])
+            fillable[d] = fillable[d + 1] + (1 if first else 0)
+        choice = [-1] * n
+        forced = [False] * n
+        alternates = 0
+        depth = 0
+        while depth >= 0:
+            if depth == n:
+                devices = list(fixed)
+                for k in range(n):
+                    devices.append((ambiguous[k][0], ambiguous[k][1][order[k][choice[k]]]))
+                self._keep(kept, limit, self._assignment(devices, alternates, bom))
+                depth -= 1
+                continue
+            candidates = ambiguous[depth][1]
+            if choice[depth] >= 0:      # take back this depth's last choice
+                k = order[depth][choice[depth]]
+                m = candidates[k][2]
+                counts[m] -= 1
+                if bom != None:
+                    if counts[m] < bom.get(m, 0):
+                        missing += 1
+                    else:
+                        extra -= 1
+                if k:
+                    alternates -= 1
+            else:
+                forced[depth] = not [c for c in candidates if self._fits(c[2], counts, bom)]
+            choice[depth] += 1
+            while choice[depth] < len(candidates) and not (forced[depth] or
+                                                          self._fits(candidates[order[depth][choice[depth]]][2], counts, bom)):
+                choice[depth] += 1
+            if choice[depth] >= len(candidates):
+                choice[depth] = -1
+                depth -= 1
+                continue
+            k = order[depth][choice[depth]]
+            m = candidates[k][2]
+            if bom != None:
+                if counts.get(m, 0) < bom.get(m, 0):
+                    missing -= 1
+                else:
+                    extra += 1
+            counts[m] = counts.get(m, 0) + 1
+            if k:
+                alternates += 1
+            # each of the ID's still to go either fills a missing module (if it can be a bom module)
+            #  or adds an extra one
+            if bom != None:
+                fills = min(missing, fillable[depth + 1])
+                bound = (extra + missing + (n - depth - 1) - 2 * fills, alternates)
+            else:
+                bound = (0, alternates)
+            if len(kept) == limit and bound >= (kept[-1].mismatch, kept[-1].alternates):
+                continue                # no better, try the next candidate of this ID
+            depth += 1
+        return kept
+
+    # can one more of a module be placed, without going over its count in the bill of materials
+    @staticmethod
+    def _fits(module, counts, bom):
+        return bom == None or module not in bom or counts.get(module, 0) < bom[module]
+
+    # insert an assignment into the ranked list, keeping at most limit of them
+    @staticmethod
+    def _keep(kept, limit, assignment):
+        rank = (assignment.mismatch, assignment.alternates)
+        n = len(kept)
+        while n > 0 and (kept[n - 1].mismatch, kept[n - 1].alternates) > rank:
+            n -= 1
+        if n < limit:
+            kept.insert(n, assignment)
+            if len(kept) > limit:
+                kept.pop()
+
+    # rank one assignment [(ID, (source, short_name, module)), ...] against the bill of materials
+    def _assignment(self, devices, alternates, bom):
+        devices.sort()
+        missing = []
+        extra = []
+        if bom != None:
+            counts = {}
+            for i, (source, short_name, module) in devices:
+                counts[module] = counts.get(module, 0) + 1
+            for m in bom:
+                missing += [m] * max(bom[m] - counts.get(m, 0), 0)
+            for m in counts:
+                extra += [m] * max(counts[m] - bom.get(m, 0), 0)
+        return Piico_assignment(len(missing) + len(extra), alternates,
+                                tuple([(i, c[1]) for i, c in devices]), tuple(missing), tuple(extra))
+
+    # the solver's ambiguity table of a lookup index, {ID: ((source, short_name, module), ...)}
+    #  in the index order, so the main (default) device of an ID comes first
+    #  built once per index, the internal one once per class
+    def _ambiguity(self, index):
+        cls = type(self)
+        if index is cls._base_index:
+            if cls._base_ambiguity == None:
+                cls._base_ambiguity = self._candidates(index)
+            return cls._base_ambiguity
+        if self._ext_ambiguity == None or self._ext_ambiguity[0] is not index:
+            self._ext_ambiguity = (index, self._candidates(index))
+        return self._ext_ambiguity[1]
+
+    def _candidates(self, index):
+        table = {}
+        for i in index:
+            table[i] = tuple([(source, t[i]['short_name'], _module(t[i]['short_name'])) for source, t in index[i]])
+        return table
                 
     # Print common functions
     # print information from  the main dictionary
     def print_main(self, id, mode):
-        if mode == 'long':
-            s = self.PiicoDev_list[id]['long_name']
-        elif mode == 'short':
-            s = self.PiicoDev_list[id]['short_name']
-        else:   # assume 'what'
-            s = self.PiicoDev_list[id]['what']
-        print(id, hex(id), s)
+        print(id, hex(id), self.PiicoDev_list[id][self._keys.get(mode, 'what')])
 
     # print information from  the conflicts dictionary
     def print_conf(self, id, mode):
-        if mode == 'long':
-            s = self.PiicoDev_conf_list[id]['long_name']
-        elif mode == 'short':
-            s = self.PiicoDev_conf_list[id]['short_name']
-        else:   # assume 'what'
-            s = self.PiicoDev_conf_list[id]['what']
-        print(id, hex(id), s)
+        print(id, hex(id), self.PiicoDev_conf_list[id][self._keys.get(mode, 'what')])
 
     # print information from the external user dictionary
     def print_ext(self, i, mode, extlist):
-        if mode == 'long':
-            s = extlist[i]['long_name']
-        elif mode == 'short':
-            s = extlist[i]['short_name']
-        else:   # assume 'what'
-            s = extlist[i]['what']
-        print(i, hex(i), s)
+        print(i, hex(i), extlist[i][self._keys.get(mode, 'what')])
 
 #
 # end of  class
 #
 ###########################################
 
+
+# the bus object and scan result shared by the shared=True instances on one bus
+class _Shared_bus(object):
+    def __init__(self):
+        self.i2c = None
+        self.connected = None
+        self.generation = 0
+
+
 if _Debug:
     tests = Piico_info()
 
@@ -0,0 +1,130 @@
+"""
+ Piico_monitor.py
+
+ Debounced presence supervision of the expected PiicoDev devices
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+from array import array
+
+from Piico_info import ticks_us
+
+
+class Piico_monitor(object):
+    """
+    Continuous presence supervision of an expected set of ID's, for a timer loop or a task
+    
+        from Piico_monitor import Piico_monitor
+        monitor = Piico_monitor(tests, [0x3c, 0x52, 0x77], debounce=3, size=32)
+        while True:
+            if monitor.poll():          # probes the expected ID's, True if any debounced state changed
+                for t, id, attached in monitor.events():
+                    print(t, hex(id), 'attached' if attached else 'detached')
+            time.sleep_ms(100)
+    
+    poll() only probes the expected ID's, and a device only changes state (attached/detached) after
+    debounce consecutive probes disagree with it, so a flapping connector doesn't flood the events.
+    Each change is recorded (ticks_us(), ID, attached) in a ring buffer of size events, the oldest are
+    overwritten (and counted in lost) if events() isn't called often enough.
+    Everything is allocated here, poll() and is_present() allocate nothing while the devices ACK
+    (a missing device costs whatever the port allocates for the OSError of the NACK).
+    
+        poll()                  - probes the expected ID's once, returns True if any state changed
+        is_present(id)          - returns 1 if the debounced state of an expected ID is attached
+        all_present()           - returns 1 if every expected ID is attached
+        pending()               - returns the number of events not yet read
+        events()                - returns the pending events [(ticks_us, ID, attached), ...] and clears them
+    """
+
+    def __init__(self, info, expected, debounce=3, size=32):
+        self.info = info
+        self.ids = bytes(sorted(expected))
+        self.debounce = debounce
+        self.state = bytearray(len(self.ids))
+        self.count = bytearray(len(self.ids))
+        for n in range(len(self.ids)):
+            self.state[n] = info.is_ID_connected(self.ids[n])
+        self.size = size
+        self._event_id = bytearray(size)        # ID, bit 7 set if attached
+        self._event_time = array('L', [0] * size)
+        self._head = 0
+        self._pending = 0
+        self.lost = 0
+
+    # poll() - probes the expected ID's once, returns True if any debounced state changed
+    def poll(self):
+        ids = self.ids
+        state = self.state
+        count = self.count
+        changed = False
+        n = 0
+        while n < len(ids):     # not range(), a range object is an allocation under CPython
+            now = self.info.probe(ids[n])
+            if now == state[n]:
+                count[n] = 0
+            elif count[n] + 1 < self.debounce:
+                count[n] += 1
+            else:
+                count[n] = 0
+                state[n] = now
+                self._event(ids[n], now)
+                changed = True
+            n += 1
+        return changed
+
+    # record one state change
+    def _event(self, id, attached):
+        head = self._head
+        self._event_id[head] = id | (attached << 7)
+        self._event_time[head] = ticks_us()
+        self._head = (head + 1) % self.size
+        if self._pending == self.size:
+            self.lost += 1
+        else:
+            self._pending += 1
+
+    # is_present(id) - returns 1 if the debounced state of an expected ID is attached, otherwise 0
+    def is_present(self, id):
+        ids = self.ids
+        n = 0
+        while n < len(ids):
+            if ids[n] == id:
+                return self.state[n]
+            n += 1
+        return(0)
+
+    # all_present() - returns 1 if every expected ID is attached, otherwise 0
+    def all_present(self):
+        state = self.state
+        n = 0
+        while n < len(state):
+            if not state[n]:
+                return(0)
+            n += 1
+        return(1)
+
+    # pending() - returns the number of events not yet read
+    def pending(self):
+        return self._pending
+
+    # events() - returns the pending events [(ticks_us, ID, attached), ...] oldest first, and clears them
+    def events(self):
+        events = []
+        start = (self._head - self._pending) % self.size
+        for n in range(self._pending):
+            e = self._event_id[(start + n) % self.size]
+            events.append((self._event_time[(start + n) % self.size], e & 0x7f, e >> 7))
+        self._pending = 0
+        return events
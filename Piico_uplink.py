@@ -0,0 +1,166 @@
+"""
+ Piico_uplink.py
+
+ Compact binary PiicoDev inventory reports for a low bandwidth link
+
+ (c) 2024 Murray Taylor
+
+    This program is free software; you can redistribute it and/or
+    modify it under the terms of the BSD 3-clause License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+    You should have received a copy of the BSD 3-clause License
+    along with this program; if not, a copy is available on the web at
+    https://https://opensource.org/license/bsd-3-clause/
+"""
+
+from collections import namedtuple
+
+from Piico_info import _PIICODEV, _fnv1a
+
+
+# the catalogue version sent with a report, changes with any row's ID, order or short_name
+_CATALOGUE_VERSION = _fnv1a(' '.join(['%x %s' % (row[0], row[3]) for row in _PIICODEV])) & 0xffff
+
+# what Piico_uplink.decode() returns, devices is ((ID, short_name), ...), None if unknown or unresolved
+Piico_inventory = namedtuple('Piico_inventory', ('seq', 'connected', 'devices'))
+
+
+class Piico_uplink(object):
+    """
+    Compact binary inventory reports, e.g. for a low bandwidth radio link (PiicoDev Transceiver)
+    
+        from Piico_uplink import Piico_uplink
+        board = Piico_uplink(tests)             # on the board
+        radio.send(board.encode())              # ~20 bytes for a full report, 6 for an unchanged one
+    
+        receiver = Piico_uplink()               # upstream, Piico_info imports without machine
+        report = receiver.decode(data)          # Piico_inventory(seq, connected, devices)
+        report.devices                          # ((ID, short_name), ...), None if unknown/unresolved
+    
+    A full report is
+        0x10, catalogue version (2 bytes), seq, presence bitmap (16 bytes, see presence()),
+        then the catalogue row (index into _PIICODEV) of each connected conflicting ID, 0xff if unresolved
+    and a delta against the previous report is
+        0x11, catalogue version (2 bytes), seq, previous seq, number of ID's that attached/detached,
+        those ID's, then (ID, catalogue row) pairs of the conflicting ID's whose device changed
+    The other ID's need no names, the receiver looks them up in its own copy of the catalogue,
+    so both ends must have the same catalogue version.
+    
+        encode()                - returns the next report, a delta if it is shorter than a full one
+            encode(True)        - a full report, send one every so often in case a report is lost
+            encode(False, False)- as above, without reading the ID registers of the conflicting ID's
+        decode(data)            - returns the Piico_inventory of a report, ValueError if the catalogue
+                                  version differs, a delta doesn't follow the last decoded report, or
+                                  the report is truncated or corrupted (the last good one is kept)
+    """
+
+    version = _CATALOGUE_VERSION
+    _rows = None    # {ID: (main row, conflict row)} of the catalogue, built on first use
+
+    def __init__(self, info=None):
+        self.info = info
+        self.seq = 0
+        self._present = None    # the last report encoded/decoded
+        self._states = {}       # {ID: catalogue row} of its conflicting ID's
+
+    @classmethod
+    def _catalogue_rows(cls):
+        if cls._rows == None:
+            rows = {}
+            for n in range(len(_PIICODEV)):
+                id = _PIICODEV[n][0]
+                rows[id] = rows.get(id, ()) + (n,)
+            cls._rows = rows
+        return cls._rows
+
+    # encode(full, resolve) - returns the next report as bytes
+    def encode(self, full=False, resolve=True):
+        rows = self._catalogue_rows()
+        snap = self.info.snapshot()
+        states = {}
+        for i in snap.connected:
+            if i in rows and len(rows[i]) > 1:
+                which = self.info._which(i) if resolve else None
+                states[i] = rows[i][which] if which != None else 0xff
+        previous = self.seq
+        self.seq = (self.seq + 1) & 0xff
+        report = bytearray((0x10, self.version & 0xff, self.version >> 8, self.seq))
+        report += snap.present
+        for i in sorted(states):
+            report.append(states[i])
+        if not full and self._present != None:
+            delta = bytearray((0x11, self.version & 0xff, self.version >> 8, self.seq, previous, 0))
+            for i in range(128):
+                if (snap.present[i >> 3] ^ self._present[i >> 3]) & (1 << (i & 7)):
+                    delta.append(i)
+                    delta[5] += 1
+            for i in sorted(states):
+                if self._states.get(i) != states[i]:
+                    delta.append(i)
+                    delta.append(states[i])
+            if len(delta) < len(report):
+                report = delta
+        self._present = snap.present
+        self._states = states
+        return bytes(report)
+
+    # decode(data) - returns the Piico_inventory (seq, connected, devices) of a report
+    def decode(self, data):
+        rows = self._catalogue_rows()
+        if len(data) < 4 or data[0] not in (0x10, 0x11):
+            raise ValueError('not a Piico_uplink report')
+        if data[1] | data[2] << 8 != self.version:
+            raise ValueError('catalogue version %04x, expected %04x' % (data[1] | data[2] << 8, self.version))
+        if data[0] == 0x10:
+            if len(data) < 20:
+                raise ValueError('full report of %d bytes, at least 20 expected' % len(data))
+            present = bytes(data[4:20])
+            connected = self._connected(present)
+            conflicts = [i for i in connected if i in rows and len(rows[i]) > 1]
+            if len(data) != 20 + len(conflicts):
+                raise ValueError('full report of %d bytes, %d expected' % (len(data), 20 + len(conflicts)))
+            states = {}
+            for n in range(len(conflicts)):
+                states[conflicts[n]] = data[20 + n]
+        else:
+            if len(data) < 6 or len(data) < 6 + data[5] or (len(data) - 6 - data[5]) & 1:
+                raise ValueError('delta report of %d bytes doesn\'t match its contents' % len(data))
+            if self._present == None or data[4] != self.seq:
+                raise ValueError('report %d is a delta on %d, the last one decoded is %d' % (data[3], data[4], self.seq))
+            present = bytearray(self._present)
+            count = data[5]
+            for i in data[6:6 + count]:
+                if i >= 128:
+                    raise ValueError('delta report toggles ID %d' % i)
+                present[i >> 3] ^= 1 << (i & 7)
+            present = bytes(present)
+            connected = self._connected(present)
+            states = {}
+            for i in connected:
+                if i in self._states:
+                    states[i] = self._states[i]
+            for n in range(6 + count, len(data), 2):
+                states[data[n]] = data[n + 1]
+            conflicts = [i for i in connected if i in rows and len(rows[i]) > 1]
+            if sorted(states) != conflicts:
+                raise ValueError('delta report doesn\'t match the conflicting ID\'s connected')
+        for i in states:
+            if states[i] != 0xff and states[i] not in rows[i]:
+                raise ValueError('catalogue row %d is not a device at ID %d' % (states[i], i))
+        self.seq = data[3]
+        self._present = present
+        self._states = states
+        devices = []
+        for i in connected:
+            row = states[i] if i in states else (rows[i][0] if i in rows else 0xff)
+            devices.append((i, _PIICODEV[row][3] if row < len(_PIICODEV) else None))
+        return Piico_inventory(self.seq, connected, tuple(devices))
+
+    # the connected ID's of a presence bitmap
+    @staticmethod
+    def _connected(present):
+        return [i for i in range(128) if present[i >> 3] & (1 << (i & 7))]
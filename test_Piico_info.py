@@ -0,0 +1,733 @@
+"""
+ test_Piico_info.py
+
+ Piico_info behaviour on the simulated PiicoDev bus of Piico_bench (CPython, pytest)
+"""
+
+import sys
+import asyncio
+
+import pytest
+
+import Piico_bench
+
+POPULATION = sorted(Piico_bench.DEFAULT_POPULATION)
+
+
+# forget Piico_info and the modules built on it (Piico_busset ...), the next import starts afresh
+def forget():
+    for name in [m for m in sys.modules if m.startswith('Piico_') and m != 'Piico_bench']:
+        del sys.modules[name]
+
+
+# a fresh Piico_info module on a simulated bus, the class level caches start empty each time
+@pytest.fixture
+def piico():
+    def load(**settings):
+        Piico_bench.install(**settings)
+        forget()
+        import Piico_info
+        return Piico_info
+    yield load
+    forget()
+
+
+def test_full_scan(piico):
+    t = piico().Piico_info()
+    assert t.connected == POPULATION
+    assert t.i2c.scans == 1
+
+
+def test_targeted_only_probes_the_catalogue(piico):
+    t = piico().Piico_info(targeted=True)
+    assert t.connected == POPULATION
+    assert t.i2c.scans == 0
+    assert t.i2c.probes == len(t.probe_set)
+    t.rescan(True)
+    assert t.i2c.scans == 1
+
+
+def test_rescan_diffs_and_callbacks(piico):
+    t = piico().Piico_info()
+    events = []
+    t.on_change(lambda id, attached: events.append((id, attached)))
+    t.i2c.population.add(0x44)
+    t.i2c.population.discard(0x10)
+    assert t.rescan() == ([0x44], [0x10])
+    assert sorted(events) == [(0x10, 0), (0x44, 1)]
+    assert t.rescan() == ([], [])
+    servo = []
+    t.on_change(lambda id, attached: servo.append(attached), 0x44)
+    t.i2c.population.discard(0x44)
+    t.i2c.population.add(0x10)
+    t.rescan()
+    assert servo == [0]
+    t.remove_callback(t._callbacks[0x44][0], 0x44)
+    assert 0x44 not in t._callbacks
+
+
+def test_lazy_doesnt_open_the_bus(piico):
+    t = piico().Piico_info(lazy=True)
+    assert t._i2c == None
+    assert t.is_ID_connected(0x77)
+    assert t.i2c.scans == 1
+    t = piico().Piico_info(lazy=True)
+    t.prefetch()
+    t.prefetch()
+    assert t.connected == POPULATION
+    assert t.i2c.scans == 1
+
+
+# each entry of the identify list: ID, ID register and its contents, the device it identifies (None unresolved)
+@pytest.mark.parametrize('id, register, value, short_name', (
+    (0x35, 0x01, b'\x02\x42', 'ULTRASONIC'),        # WHOAMI 578
+    (0x35, 0x01, b'\x01\x7b', 'Potentiometer'),     # 379, rotary
+    (0x35, 0x01, b'\x01\x9b', 'Potentiometer'),     # 411, slide
+    (0x35, 0x01, b'\x00\x00', None),
+    (0x48, 0x0f, b'\x01\x17', 'TMP117'),
+    (0x48, 0x0f, b'\x31\x17', 'TMP117'),            # the revision bits are masked off
+    (0x48, 0x0f, b'\x00\x00', 'VEML6030 (ASW on)'),
+    (0x52, 0x00, b'\x60\x01', 'ENS160 (ASW on)'),   # PART_ID 0x0160, little endian
+    (0x52, 0x00, b'\x00\x00', 'RV3028'),
+))
+def test_identify_reads_the_id_register(piico, id, register, value, short_name):
+    t = piico(population=(0x10, id, 0x77), registers={(id, register): value}).Piico_info()
+    entry = t.identify(id)
+    assert (entry['short_name'] if entry != None else None) == short_name
+    for name in t.lookup_id(id):
+        assert t.is_device_connected(name.short_name) == (name.short_name == short_name)
+
+
+def test_identify_is_cached_per_scan(piico):
+    t = piico(population=(0x10, 0x48, 0x77), registers={(0x48, 0x0f): b'\x01\x17'}).Piico_info()
+    assert t.identify(0x77)['short_name'] == 'BME280'
+    assert t.identify(0x10) == None     # VEML6030/VEML6040, no ID register
+    assert t.identify(0x3c) == None     # not connected
+    probes = t.i2c.probes
+    assert t.identify(0x48)['short_name'] == 'TMP117'
+    assert t.i2c.probes == probes + 1
+    assert t.identify(0x48)['short_name'] == 'TMP117'
+    assert t.is_device_connected('TMP117')
+    assert t.i2c.probes == probes + 1
+    t.i2c.registers[(0x48, 0x0f)] = b'\x00\x00'
+    t.rescan()
+    probes = t.i2c.probes
+    assert t.identify(0x48)['short_name'] == 'VEML6030 (ASW on)'
+    assert t.i2c.probes == probes + 1
+
+
+def test_batch_presence_queries(piico):
+    t = piico().Piico_info()    # 0x10, 0x3c, 0x52, 0x53, 0x77
+    required = [0x3c, 0x44, 0x77, 0x48]
+    assert t.are_connected(required) == (1, 0, 1, 0)
+    assert t.connected_mask(required) == 0b0101
+    assert t.missing(required) == [0x44, 0x48]
+    assert t.unexpected(required) == [0x10, 0x52, 0x53]
+    assert t.presence() == sum([1 << i for i in POPULATION])
+    t.i2c.population.add(0x44)
+    t.rescan()
+    assert t.connected_mask(required) == 0b0111
+
+
+def test_is_id_connected_outside_the_bitmap(piico):
+    t = piico().Piico_info()
+    for id in (None, 'BME280', -1, 128, 0x44):
+        assert t.is_ID_connected(id) == 0
+    assert t.is_ID_connected(119.0) == 1    # == 119, as the list search before the bitmap
+    assert t.are_connected([None, 0x77]) == (0, 1)
+    assert t.connected_mask([None, 0x77]) == 0b10
+    assert t.missing([None, 0x77]) == [None]
+    assert t.identify(None) == None
+
+
+def test_report_buffer_is_allocated_by_the_first_report(piico):
+    import io
+    P = piico()
+    t = P.Piico_info(lazy=True)
+    assert t._report == None
+    assert P.Piico_info(shared=True)._report == None
+    out = io.StringIO()
+    assert t.show_int(out) == POPULATION
+    assert out.getvalue() == str(POPULATION) + '\n'
+    report = t.report
+    t.details('short', None, False, out)
+    assert t.report is report
+    t.report = P.Piico_report(8)    # grows to fit
+    t.what_is(0x3c, 'long', None, out)
+    assert t.report.text() == '60 0x3c PiicoDev OLED Module SSD1306\n'
+
+
+# two buses whose rescans only go ahead once both are being scanned, so scan() must use two threads
+def parallel_buses(P, failing=None):
+    import threading
+    from Piico_busset import Piico_busset
+    both = threading.Barrier(2, timeout=2)
+    threads = set()
+    buses = Piico_busset()
+    for name, population in ((0, (0x3c, 0x77)), (1, (0x10,))):
+        info = P.Piico_info(i2c=Piico_bench.SimI2C(population=population), lazy=True)
+
+        def rescan(full=False, rescan=info.rescan, fail=name == failing):
+            threads.add(threading.get_ident())
+            both.wait()
+            if fail:
+                raise OSError(110)
+            return rescan(full)
+        info.rescan = rescan
+        buses.add(name, info)
+    return buses, threads
+
+
+def test_busset_scans_both_buses_at_once(piico):
+    buses, threads = parallel_buses(piico())
+    inventory = buses.scan()
+    assert len(threads) == 2
+    assert buses._active == 0       # the second thread is done when scan() returns
+    assert sorted(inventory) == [(0, 0x3c), (0, 0x77), (1, 0x10)]
+    assert [r.short_name for r in inventory[(1, 0x10)]] == ['VEML6040', 'VEML6030 (ASW off)']
+    assert inventory[(0, 0x77)][0].short_name == 'BME280'
+
+
+def test_busset_raises_once_both_buses_are_done(piico):
+    buses = parallel_buses(piico(), failing=1)[0]
+    with pytest.raises(OSError):
+        buses.scan()
+    assert buses._active == 0
+    assert buses._done == 2
+    assert buses.buses[0]._snapshot.connected == [0x3c, 0x77]   # the other bus was still scanned
+
+
+def test_rescan_async_same_as_rescan(piico):
+    t = piico().Piico_info()
+    t.i2c.population.add(0x44)
+    assert asyncio.run(t.rescan_async(False, 4)) == ([0x44], [])
+    assert t.connected == t.scan()
+
+    async def alongside():     # another task runs between the batches of probes
+        turns = [0]
+
+        async def other():
+            while True:
+                turns[0] += 1
+                await asyncio.sleep(0)
+        task = asyncio.create_task(other())
+        found = await t.scan_async(True, 8)
+        task.cancel()
+        return found, turns[0]
+    found, turns = asyncio.run(alongside())
+    assert found == t.connected
+    assert turns >= (0x78 - 0x08) // 8 - 1
+
+
+def test_stats_split_acks_nacks_and_errors(piico):
+    t = piico(error_rate=0.2).Piico_info(instrument=True)
+    for _ in range(4):
+        t.rescan()
+    stats = t.stats()
+    assert stats['scans'] == 5
+    assert sum(stats['scan_hist']) == 5
+    assert sorted(stats['ids']) == list(range(0x08, 0x78))     # a full sweep probes one ID at a time
+    errors = 0
+    for i, (acks, nacks, errs, mean, most) in stats['ids'].items():
+        assert acks + nacks + errs == 5
+        assert (nacks if i in POPULATION else acks) == 0        # ETIMEDOUT is an error, not a NACK
+        assert mean <= most
+        errors += errs
+    assert errors > 0
+    bus = t.i2c
+    writeto = bus.writeto
+
+    def eio(addr, buf, stop=True):
+        if addr == 0x44:
+            raise OSError(5)    # EIO, the rp2 NACK
+        return writeto(addr, buf, stop)
+    bus.writeto = eio
+    t.reset_stats()
+    assert t.stats() == {'scans': 0, 'scan_us': 0, 'scan_us_max': 0, 'scan_hist': [0] * 24, 'ids': {}}
+    bus.error_rate = 0
+    assert t.probe(0x44) == 0
+    assert t.probe(0x77) == 1
+    assert t.stats()['ids'][0x44][:3] == (0, 1, 0)
+    assert t.stats()['ids'][0x77][:3] == (1, 0, 0)
+
+
+def test_stats_histogram_buckets(piico):
+    t = piico().Piico_info(lazy=True)
+    assert t.stats() == None
+    t.instrument()
+    for us in (0, 1, 1000, 1023, 1024, 1 << 30):
+        t._record_scan(us)
+    hist = t.stats()['scan_hist']
+    assert hist[0] == 1             # 0 us, < 2**0
+    assert hist[1] == 1             # < 2**1
+    assert hist[10] == 2            # 1000 and 1023 us, < 2**10
+    assert hist[11] == 1
+    assert hist[23] == 1            # anything longer lands in the last bucket
+    assert t.stats()['scan_us_max'] == 1 << 30
+    t.instrument(False)
+    assert t.stats() == None
+
+
+def test_autofreq_calibrates_on_the_first_rescan(piico):
+    P = piico(max_freq=400_000)
+    t = P.Piico_info(lazy=True, autofreq=True, freq=100_000)
+    t.rescan()
+    assert t.freq == 400_000
+    assert t.i2c.freq == 400_000
+    assert t._freq_cache == {t._key: 400_000}
+    scans = t.i2c.scans
+    t.rescan()
+    assert t.i2c.scans == scans + 1     # calibrated once
+    t = piico(max_freq=400_000).Piico_info(lazy=True, autofreq=True, freq=100_000)
+    asyncio.run(t.rescan_async())
+    assert t.freq == 400_000
+    assert t._key in t._freq_cache
+
+
+EXTERN = {
+    0x40: {'what': 'Current Sensor', 'long_name': 'Adafruit INA219 Current Sensor', 'short_name': 'INA219'},
+    0x53: {'what': 'Ambient Light-UV Sensor', 'long_name': 'Adafruit LTR390 Ambient Light-UV Sensor', 'short_name': 'LTR390'},
+    0x77: {'what': 'Pressure Sensor', 'long_name': 'Adafruit BMP388 Pressure Sensor', 'short_name': 'BMP388'},
+}
+
+
+def test_catalogue_file_reads_like_the_dictionary(piico, tmp_path):
+    import io
+    t = piico(population=(0x10, 0x3c, 0x40, 0x53, 0x77)).Piico_info()
+    from Piico_catalogue import Piico_catalogue
+    path = str(tmp_path / 'extern.txt')
+    Piico_catalogue.create(path, EXTERN)
+    ext = Piico_catalogue(path)
+    assert sorted(ext) == sorted(EXTERN)
+    for report in (lambda extlist, out: t.details('long', extlist, False, out),
+                   lambda extlist, out: t.what_is(0x53, 'short', extlist, out),
+                   lambda extlist, out: t.show_all('what', 'show', extlist, out)):
+        expected, out = io.StringIO(), io.StringIO()
+        assert report(ext, out) == report(EXTERN, expected)
+        assert out.getvalue() == expected.getvalue()
+    assert t.conflicts(ext) == t.conflicts(EXTERN)
+
+
+def test_catalogue_file_comments_and_repeated_ids(piico, tmp_path):
+    from Piico_catalogue import Piico_catalogue
+    path = str(tmp_path / 'extern.txt')
+    with open(path, 'wb') as f:
+        f.write(b'# ID\twhat\tshort_name\tlong_name\n'
+                b'0x40\tCurrent Sensor\tINA219\tAdafruit INA219 Current Sensor\n'
+                b'# 0x42\tcommented out\tINA260\tAdafruit INA260\n'
+                b'\n'
+                b'64\tPower Monitor\tINA260\tthe second line for 0x40, ignored\n'
+                b'0x41\tTriple Current Sensor\tINA3221\r\n')     # CRLF, no long_name
+    ext = Piico_catalogue(path)
+    assert sorted(ext) == [0x40, 0x41]
+    assert 0x42 not in ext
+    assert ext.get(0x42) == None
+    assert ext[0x40]['short_name'] == 'INA219'
+    assert ext[0x41] == {'what': 'Triple Current Sensor', 'short_name': 'INA3221', 'long_name': ''}
+
+
+def test_shared_instances_adopt_one_scan(piico):
+    P = piico()
+    a = P.Piico_info(shared=True)
+    b = P.Piico_info(shared=True)
+    assert b.i2c is a.i2c
+    assert b.connected == POPULATION
+    assert a.i2c.scans == 1
+    events = []
+    b.on_change(lambda id, attached: events.append((id, attached)))
+    a.i2c.population.add(0x44)
+    a.rescan()
+    assert b.is_ID_connected(0x44)
+    assert events == [(0x44, 1)]
+    assert a.i2c.scans == 2
+    b.invalidate()
+    a.connected
+    b.connected
+    assert a.i2c.scans == 3
+
+
+def test_shared_instances_need_the_same_scan_mode(piico):
+    P = piico()
+    a = P.Piico_info(shared=True, targeted=True, probe_set=[0x10])
+    b = P.Piico_info(shared=True)
+    c = P.Piico_info(shared=True, targeted=True, probe_set=[0x10, 0x77])
+    d = P.Piico_info(shared=True, targeted=True, probe_set=[0x10])
+    assert a.connected == [0x10]
+    assert b.connected == POPULATION
+    assert c.connected == [0x10, 0x77]
+    assert d._shared is a._shared
+    assert d.connected == [0x10]
+    assert d.i2c is a.i2c
+
+
+def test_autofreq_reuses_the_calibration(piico):
+    P = piico(max_freq=400_000)
+    a = P.Piico_info(autofreq=True)
+    assert a.freq == 400_000
+    b = P.Piico_info(autofreq=True)
+    assert b.freq == 400_000
+    assert b.i2c.freq == 400_000
+    assert b.i2c.scans == 1     # no second calibration
+
+
+def wait_for(condition, timeout=2.0):
+    import time
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.001)
+    return condition()
+
+
+def test_scanner_stops_on_a_callback_error_and_restarts(piico):
+    t = piico().Piico_info()
+
+    def fail(id, attached):
+        raise RuntimeError('callback')
+    t.on_change(fail)
+    assert t.start_scanner(1)
+    t.i2c.population.add(0x44)
+    assert wait_for(lambda: not t._scanner_running)
+    assert isinstance(t.scanner_error, RuntimeError)
+    t.remove_callback(fail)
+    assert t.start_scanner(1)
+    t.i2c.population.discard(0x44)
+    assert wait_for(lambda: not t.is_ID_connected(0x44))
+    t.stop_scanner()
+    assert wait_for(lambda: not t._scanner_running)
+
+
+def test_scanner_restart_keeps_one_thread(piico):
+    t = piico().Piico_info()
+    live = [0, 0]   # running, most at once
+    scanner = t._scanner
+
+    def counted(*args):
+        live[0] += 1
+        live[1] = max(live)
+        try:
+            scanner(*args)
+        finally:
+            live[0] -= 1
+    t._scanner = counted
+    assert t.start_scanner(1)
+    t.stop_scanner()
+    assert t.start_scanner(1)
+    assert t.start_scanner(1)
+    t.stop_scanner()
+    assert wait_for(lambda: live[0] == 0)
+    assert live[1] == 1
+
+
+# stand-ins for PiicoDev_Unified and two drivers, one taking address=, one taking addr=
+#  I2CUnifiedMachine checks its arguments as the real one does, bus, sda and scl all or none
+@pytest.fixture
+def piicodev(monkeypatch):
+    import machine
+    unified = type(sys)('PiicoDev_Unified')
+    unified.I2C = machine.I2C
+
+    class I2CUnifiedMachine(object):
+        def __init__(self, bus=None, freq=None, sda=None, scl=None):
+            if freq is None:
+                freq = 400_000
+            if bus is not None and sda is not None and scl is not None:
+                self.i2c = unified.I2C(bus, freq=freq, sda=sda, scl=scl)
+            elif bus is None and sda is None and scl is None:
+                self.i2c = unified.I2C(0, scl=machine.Pin(9), sda=machine.Pin(8), freq=freq)
+            else:
+                raise Exception('Please provide at least bus, sda, and scl')
+
+    def create_unified_i2c(bus=None, freq=None, sda=None, scl=None):
+        return I2CUnifiedMachine(bus, freq, sda, scl)
+    unified.create_unified_i2c = create_unified_i2c
+
+    oled = type(sys)('PiicoDev_SSD1306')
+
+    def create_PiicoDev_SSD1306(bus=None, freq=None, sda=None, scl=None, address=0x3c):
+        d = type('SSD1306', (), {})()
+        d.i2c = create_unified_i2c(bus, freq, sda, scl)
+        d.i2c.i2c.writeto(address, b'')     # set up on the bus it was given
+        d.address = address
+        d.pins = (scl, sda)
+        return d
+    oled.create_PiicoDev_SSD1306 = create_PiicoDev_SSD1306
+
+    tmp = type(sys)('PiicoDev_TMP117')
+
+    class PiicoDev_TMP117(object):
+        def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x48):
+            self.i2c = create_unified_i2c(bus, freq, sda, scl)
+            self.addr = addr
+    tmp.PiicoDev_TMP117 = PiicoDev_TMP117
+
+    for m in (unified, oled, tmp):
+        monkeypatch.setitem(sys.modules, m.__name__, m)
+    return unified
+
+
+def test_driver_shares_the_bus(piico, piicodev):
+    t = piico(population=(0x3c, 0x48), registers={(0x48, 0x0f): b'\x01\x17'}).Piico_info()
+    probes = t.i2c.probes
+    oled = t.driver(0x3c)
+    assert oled.address == 0x3c
+    assert oled.i2c.i2c is t.i2c
+    assert t.i2c.probes == probes + 1   # the driver's own setup ran on this bus
+    assert t.driver(0x48).addr == 0x48
+    assert t.driver(0x48).i2c.i2c is t.i2c
+    assert sys.modules['PiicoDev_Unified'].I2C is not None
+    scl, sda = Piico_bench.SimPin(7), Piico_bench.SimPin(6)
+    alt = piico().Piico_info(id=1, scl=scl, sda=sda)
+    assert alt.driver(0x3c).pins == (scl, sda)
+    given = piico().Piico_info(i2c=Piico_bench.SimI2C())     # pins unknown, the default numbers pass the check
+    assert given.driver(0x3c).i2c.i2c is given.i2c
+
+
+def test_drivers_skips_unusable_drivers(piico, piicodev):
+    t = piico(population=(0x3c, 0x44, 0x77)).Piico_info()   # PiicoDev_BME280 isn't installed
+
+    def wrong_arguments(i2c, id):
+        raise TypeError('unexpected keyword')
+    t.set_driver(0x44, wrong_arguments)
+    assert list(t.drivers()) == [0x3c]
+
+
+def test_uplink_round_trip_and_bad_reports(piico):
+    t = piico(population=(0x3c, 0x48, 0x52, 0x77)).Piico_info()
+    from Piico_uplink import Piico_uplink
+    board = Piico_uplink(t)
+    receiver = Piico_uplink()
+    full = board.encode()
+    assert receiver.decode(full).connected == t.connected
+    t.i2c.population.add(0x44)
+    t.rescan()
+    delta = board.encode()
+    assert len(delta) < len(full)
+    report = receiver.decode(delta)
+    assert report.connected == t.connected
+    assert (0x44, 'SERVO') in report.devices
+    # truncated/padded full reports, a delta short of its count, a delta naming a 5th device at 0x44
+    for bad in (full[:-1], full[:12], full + b'\x00', delta[:-1], delta[:5] + b'\x02\x44'):
+        receiver = Piico_uplink()
+        receiver.decode(full)
+        with pytest.raises(ValueError):
+            receiver.decode(bad)
+        assert receiver.seq == full[3]
+
+
+def test_warm_start_verifies_only(piico, tmp_path):
+    cache = str(tmp_path / 'piico.txt')
+    t = piico().Piico_info(targeted=True, cache=cache)
+    assert t.from_cache == 0
+    t = piico().Piico_info(targeted=True, cache=cache)
+    assert t.from_cache == 1
+    assert t.i2c.probes == len(POPULATION)
+
+
+def test_warm_start_with_autofreq_doesnt_calibrate(piico, tmp_path):
+    cache = str(tmp_path / 'piico.txt')
+    t = piico(max_freq=400_000).Piico_info(autofreq=True, cache=cache)
+    assert t.from_cache == 0
+    assert t.freq == 400_000
+    t = piico(max_freq=400_000).Piico_info(autofreq=True, cache=cache)   # a reboot, no calibration in RAM
+    assert t.from_cache == 1
+    assert t.freq == 400_000
+    assert t.i2c.freq == 400_000
+    assert t.i2c.scans == 0
+    assert t.i2c.probes == len(POPULATION)
+    t = piico(max_freq=400_000, population=(0x3c,)).Piico_info(autofreq=True, cache=cache)
+    assert t.from_cache == 0    # a saved device is gone, calibrates and scans
+    assert t.connected == [0x3c]
+
+
+def test_solve_ranks_consistent_assignments(piico):
+    t = piico(population=(0x10, 0x48, 0x52, 0x53)).Piico_info()
+    assert len(t.solve(limit=100)) == 8
+    best = t.solve()[0]
+    assert best.alternates == 0
+    assert best.devices == ((0x10, 'VEML6040'), (0x48, 'TMP117'), (0x52, 'RV3028'), (0x53, 'ENS160 (ASW off)'))
+    for a in t.solve(['VEML6030', 'ENS160', 'ENS160', 'TMP117'], limit=100):
+        assert [name[:8] for i, name in a.devices].count('VEML6030') <= 1
+    best = t.solve(['VEML6030', 'ENS160', 'ENS160', 'TMP117'])[0]
+    assert (best.mismatch, best.missing, best.extra) == (0, (), ())
+
+
+def test_solve_stays_small_with_a_big_overlap(piico):
+    ids = (0x08, 0x10, 0x18, 0x19, 0x1a, 0x1c, 0x28, 0x29, 0x2c, 0x35, 0x3c, 0x42, 0x44, 0x48, 0x52, 0x53)
+    extlist = {}
+    for i in ids:
+        extlist[i] = {'what': 'x', 'short_name': 'EXT%d' % i, 'long_name': 'x'}
+    t = piico(population=ids).Piico_info()
+    calls = []
+    assignment = t._assignment
+    t._assignment = lambda *args: calls.append(1) or assignment(*args)
+    assert t.solve(None, extlist, limit=1)[0].alternates == 0
+    assert len(calls) == 1
+    assert len(t.solve(['EXT8', 'EXT16'], extlist)) == 8
+    assert len(calls) < 200     # not the 331776 combinations
+
+
+def test_catalogue_entries_are_built_on_first_use(piico):
+    P = piico()
+    main = P.Piico_info.PiicoDev_list
+    assert len(main._entries) == 0
+    assert main[0x77]['short_name'] == 'BME280'
+    assert list(main._entries) == [0x77]
+    assert main[0x77] is main[0x77]
+    assert P.Piico_info.PiicoDev_conf_list[0x48]['short_name'] == 'VEML6030 (ASW on)'
+    assert 0x53 not in P.Piico_info.PiicoDev_conf_list
+    with pytest.raises(ValueError):
+        P._catalogue(P._PIICODEV + ((0x35, 'x', 'x', 'x', 'x.x'),))
+
+
+# a random fleet log, JSON lines, some scans without a unit, ID 0x20 in no catalogue
+def fleet_log(seed=7, scans=300, units=9):
+    import json
+    import random
+    rnd = random.Random(seed)
+    pool = (0x10, 0x20, 0x35, 0x3c, 0x48, 0x52, 0x53, 0x77)
+    log = []
+    for _ in range(scans):
+        connected = sorted(rnd.sample(pool, rnd.randint(0, len(pool))))
+        unit = 'unit-%d' % rnd.randrange(units) if rnd.random() < 0.8 else None
+        log.append((connected, unit))
+    lines = [json.dumps(c) if u == None else json.dumps({'unit': u, 'connected': c}) for c, u in log]
+    return log, lines
+
+
+def test_fleet_matches_a_brute_force_count(piico):
+    pytest.importorskip('numpy')
+    piico()
+    from Piico_fleet import Piico_fleet
+    log, lines = fleet_log()
+    expected = {0x3c, 0x52, 0x53, 0x77}    # SSD1306, ENS160 x2, BME280
+    fleet = Piico_fleet(bom=['SSD1306', 'ENS160', 'ENS160', 0x77], chunk=7).feed(lines)
+    counts = {}
+    for connected, unit in log:
+        for i in connected:
+            counts[i] = counts.get(i, 0) + 1
+    assert fleet.scans == len(log)
+    assert fleet.attach_rates() == dict([(i, counts[i] / len(log)) for i in counts])
+    groups = {0x10: ('VEML6040', 'VEML6030 (ASW off)'), 0x35: ('ULTRASONIC', 'Potentiometer'),
+              0x48: ('TMP117', 'VEML6030 (ASW on)'), 0x52: ('RV3028', 'ENS160 (ASW on)')}
+    spots = sorted([(i, counts[i], counts[i] / len(log), groups[i]) for i in groups], key=lambda s: -s[1])
+    assert fleet.hotspots() == spots
+    for i in range(128):
+        missed = len([c for c, u in log if i in expected and i not in c])
+        extra = len([c for c, u in log if i not in expected and i in c])
+        assert (fleet.missed[i], fleet.extra[i]) == (missed, extra)
+    last = {}
+    for connected, unit in log:
+        if unit != None:
+            last[unit] = set(connected)
+    drift = {}
+    for unit in last:
+        if last[unit] != expected:
+            drift[unit] = (sorted(expected - last[unit]), sorted(last[unit] - expected))
+    assert fleet.drift() == drift
+
+
+def test_fleet_bom_takes_modules(piico):
+    pytest.importorskip('numpy')
+    piico()
+    from Piico_fleet import Piico_fleet
+    fleet = Piico_fleet()
+    assert fleet._bom_ids(['ENS160', 'VEML6030', 'LIS3DH']) == [0x53, 0x10, 0x19]
+    assert fleet._bom_ids(['ENS160', 'ENS160']) == [0x53, 0x52]
+    assert fleet._bom_ids(['VEML6030', 'VEML6040']) == [0x10, 0x48]
+    assert fleet._bom_ids(['ENS160 (ASW on)', 'ENS160', 0x77]) == [0x52, 0x77, 0x53]
+    with pytest.raises(ValueError):
+        fleet._bom_ids(['ENS160'] * 3)
+    with pytest.raises(ValueError):
+        fleet._bom_ids(['NOPE'])
+
+
+def test_fleet_command_line(piico):
+    pytest.importorskip('numpy')
+    import os
+    import subprocess
+    out = subprocess.run([sys.executable, 'Piico_fleet.py', '--bom', 'SSD1306,ENS160,0x77'], input='[16, 60]\n',
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.returncode == 0, out.stderr
+    assert '83 0x53 1 / 0' in out.stdout
+
+
+# a bus for Piico_monitor, probe() reads the present flags, nothing is allocated per probe
+class MonitorBus(object):
+    def __init__(self, *present):
+        self.bus = bytearray(128)
+        for i in present:
+            self.bus[i] = 1
+
+    def probe(self, id):
+        return self.bus[id]
+
+    is_ID_connected = probe
+
+
+def test_monitor_debounce(piico):
+    piico()
+    from Piico_monitor import Piico_monitor
+    bus = MonitorBus(0x3c, 0x77)
+    monitor = Piico_monitor(bus, [0x77, 0x3c, 0x52], debounce=3)
+    assert (monitor.is_present(0x3c), monitor.is_present(0x52), monitor.all_present()) == (1, 0, 0)
+    bus.bus[0x3c] = 0
+    assert not monitor.poll() and not monitor.poll()
+    bus.bus[0x3c] = 1                   # a flap restarts the count
+    assert not monitor.poll()
+    bus.bus[0x3c] = 0
+    assert not monitor.poll() and not monitor.poll()
+    assert monitor.is_present(0x3c) == 1 and monitor.pending() == 0
+    assert monitor.poll()               # the third probe in a row
+    assert monitor.is_present(0x3c) == 0
+    assert [e[1:] for e in monitor.events()] == [(0x3c, 0)]
+    assert monitor.events() == []
+
+
+def test_monitor_events_in_order(piico):
+    piico()
+    from Piico_monitor import Piico_monitor
+    bus = MonitorBus(0x3c)
+    monitor = Piico_monitor(bus, [0x3c, 0x52, 0x77], debounce=1)
+    bus.bus[0x77] = 1
+    bus.bus[0x52] = 1
+    assert monitor.poll()
+    bus.bus[0x3c] = 0
+    assert monitor.poll()
+    assert monitor.all_present() == 0 and monitor.pending() == 3
+    events = monitor.events()
+    assert [e[1:] for e in events] == [(0x52, 1), (0x77, 1), (0x3c, 0)]
+    assert [e[0] for e in events] == sorted([e[0] for e in events])
+    assert monitor.pending() == 0 and monitor.lost == 0
+
+
+def test_monitor_ring_overflow_is_counted(piico):
+    piico()
+    from Piico_monitor import Piico_monitor
+    bus = MonitorBus()
+    monitor = Piico_monitor(bus, [0x3c], debounce=1, size=4)
+    for n in range(6):
+        bus.bus[0x3c] ^= 1
+        assert monitor.poll()
+    assert (monitor.pending(), monitor.lost) == (4, 2)
+    assert [e[1:] for e in monitor.events()] == [(0x3c, 1), (0x3c, 0), (0x3c, 1), (0x3c, 0)]
+
+
+def test_monitor_poll_allocates_nothing(piico):
+    import tracemalloc
+    piico()
+    from Piico_monitor import Piico_monitor
+    bus = MonitorBus(0x3c, 0x77)
+    monitor = Piico_monitor(bus, [0x3c, 0x52, 0x77], debounce=3)
+    bus.bus[0x52] = 1
+    monitor.poll()      # warm up, and a debounce count under way
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        monitor.poll()
+        monitor.is_present(0x77)
+        monitor.all_present()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak - base == 0